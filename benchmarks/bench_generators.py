@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "src"))
+
+from code_parser import generate_cpp_diagram, generate_js_ts_diagram, generate_python_diagram
+
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+SAMPLES = [
+    ("python", os.path.join("test", "ragpipeline.py")),
+    ("python", os.path.join("test", "url-shorter.py")),
+    ("javascript", os.path.join("test", "test_complex.js")),
+    ("typescriptreact", os.path.join("test", "test_react.tsx")),
+]
+
+PYTHON_BLOCK = '''
+class Service{i}(Base{i}):
+    """Service number {i}."""
+
+    def __init__(self, client):
+        self.client = client
+        self.cache = {{}}
+
+    def fetch(self, key: str):
+        if key in self.cache:
+            return self.cache[key]
+        value = self.client.get(key)
+        self.cache[key] = self.normalize(value)
+        return self.cache[key]
+
+    def normalize(self, value):
+        return helper_{i}(value)
+
+def helper_{i}(value, *args, **kwargs):
+    return [item for item in value if item]
+'''
+
+JS_BLOCK = '''
+class Store{i} extends BaseStore {{
+    constructor(options) {{
+        super(options);
+        this.items = new Map();
+    }}
+
+    load(key) {{
+        if (!this.items.has(key)) {{
+            this.items.set(key, format{i}(key));
+        }}
+        return this.items.get(key);
+    }}
+}}
+
+export function format{i}(value) {{
+    return `${{value}}-{i}`.trim();
+}}
+
+const render{i} = (props) => {{
+    return format{i}(props.value);
+}};
+'''
+
+CPP_BLOCK = '''
+/** Shape number {i} */
+class Shape{i} : public Shape {{
+public:
+    Shape{i}(double size) : size_(size) {{}}
+    virtual double area() const;
+    int sides(int n);
+    void scale(double factor) {{ size_ *= factor; }}
+private:
+    double size_;
+}};
+
+double compute{i}(double value) {{
+    if (value > 0) {{
+        return value * {i};
+    }}
+    return 0;
+}}
+'''
+
+SYNTHETIC = [
+    ("python", PYTHON_BLOCK),
+    ("javascript", JS_BLOCK),
+    ("cpp", CPP_BLOCK),
+]
+
+def generate(language, code, label):
+    if language == "python":
+        return generate_python_diagram(code, label)
+    if language in ("cpp", "c"):
+        return generate_cpp_diagram(code, label)
+    return generate_js_ts_diagram(code, language, label)
+
+def make_synthetic(block, line_count):
+    parts = []
+    lines = 0
+    i = 0
+    while lines < line_count:
+        text = block.format(i=i)
+        parts.append(text)
+        lines += text.count("\n")
+        i += 1
+    return "".join(parts)
+
+def measure(language, code, label, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = generate(language, code, label)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    generate(language, code, label)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "lines": code.count("\n") + 1,
+        "seconds": best,
+        "peak_kb": peak / 1024,
+        "nodes": len(result.get("nodes", [])),
+        "links": len(result.get("links", [])),
+        "error": result.get("error"),
+    }
+
+def run(sizes, repeat):
+    results = {}
+    for language, path in SAMPLES:
+        with open(os.path.join(REPO_DIR, path), "r", encoding="utf-8") as f:
+            code = f.read()
+        results[f"{language}/{os.path.basename(path)}"] = measure(language, code, os.path.basename(path), repeat)
+
+    for language, block in SYNTHETIC:
+        for size in sizes:
+            code = make_synthetic(block, size)
+            runs = repeat if size < 50000 else 1
+            results[f"{language}/synthetic-{size}"] = measure(language, code, f"synthetic-{size}", runs)
+
+    return results
+
+def report(results, baseline=None, threshold=1.25):
+    regressions = []
+    print(f"{'case':<34} {'lines':>7} {'ms':>10} {'peak KB':>10} {'nodes':>7} {'links':>7} {'vs base':>8}")
+    for name, row in results.items():
+        ratio = ""
+        previous = (baseline or {}).get(name)
+        if previous and previous.get("seconds"):
+            value = row["seconds"] / previous["seconds"]
+            ratio = f"{value:.2f}x"
+            if value > threshold:
+                regressions.append(name)
+                ratio += " !"
+        print(f"{name:<34} {row['lines']:>7} {row['seconds'] * 1000:>10.2f} {row['peak_kb']:>10.0f} "
+              f"{row['nodes']:>7} {row['links']:>7} {ratio:>8}")
+        if row["error"]:
+            print(f"    error: {row['error']}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the diagram generators.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="synthetic input sizes in lines")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case; the best one is reported")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline file to compare against or save to")
+    parser.add_argument("--save", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = run(args.sizes, args.repeat)
+    regressions = report(results, baseline, args.threshold)
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+    elif regressions:
+        print(f"Regressions over {args.threshold:.2f}x: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "src"))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from bench_generators import SAMPLES, SYNTHETIC, make_synthetic
+from code_parser import NUMPY_LAYOUT_MIN_NODES, layout_diagram, load_numpy, parse_code
+
+FORCE_SCRIPT = os.path.join(BENCHMARK_DIR, "force_layout.js")
+D3_BUNDLE = os.path.join(REPO_DIR, "node_modules", "d3", "dist", "d3.min.js")
+
+def time_layout(diagram, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        layout_diagram(diagram)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+def time_force(diagram, d3_bundle):
+    # Without node or the d3 bundle the browser column is left empty.
+    try:
+        completed = subprocess.run(
+            ["node", FORCE_SCRIPT, d3_bundle],
+            input=json.dumps(diagram),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return json.loads(completed.stdout)["ms"]
+
+def cases(sizes):
+    for language, path in SAMPLES:
+        with open(os.path.join(REPO_DIR, path), "r", encoding="utf-8") as f:
+            yield f"{language}/{os.path.basename(path)}", language, f.read()
+    for language, block in SYNTHETIC:
+        for size in sizes:
+            yield f"{language}/synthetic-{size}", language, make_synthetic(block, size)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the parser's layout with the webview force simulation.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="synthetic input sizes in lines")
+    parser.add_argument("--repeat", type=int, default=3, help="timed layout runs per case; the best one is reported")
+    parser.add_argument("--no-force", action="store_true", help="skip the d3 force simulation")
+    parser.add_argument("--d3", default=D3_BUNDLE, help="path to d3.min.js for the force simulation")
+    args = parser.parse_args(argv)
+
+    engine = "numpy" if load_numpy() is not None else "python"
+    print(f"layout engine: {engine} from {NUMPY_LAYOUT_MIN_NODES} nodes, python below")
+    print(f"{'case':<34} {'nodes':>7} {'layout ms':>10} {'force ms':>10} {'speedup':>8}")
+    for name, language, code in cases(args.sizes):
+        diagram = parse_code(code, language, name)
+        if "error" in diagram:
+            print(f"{name:<34} error: {diagram['error']}")
+            continue
+
+        layout_ms = time_layout(diagram, args.repeat)
+        force_ms = None if args.no_force else time_force(diagram, args.d3)
+        force = f"{force_ms:.2f}" if force_ms is not None else "n/a"
+        speedup = f"{force_ms / layout_ms:.1f}x" if force_ms is not None and layout_ms else ""
+        print(f"{name:<34} {len(diagram['nodes']):>7} {layout_ms:>10.2f} {force:>10} {speedup:>8}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from code_parser import generate_python_diagram
+
+def make_nested_module(depth, calls_per_level=20):
+    lines = []
+    for level in range(depth):
+        indent = "    " * level
+        lines.append(f"{indent}def level_{level}():")
+        for i in range(calls_per_level):
+            lines.append(f"{indent}    helper_{i}(level_{max(level - 1, 0)})")
+    lines.append("")
+    for i in range(calls_per_level):
+        lines.append(f"def helper_{i}(value):")
+        lines.append("    return value")
+    return "\n".join(lines) + "\n"
+
+def run(depths=(10, 25, 50, 90), repeat=5):
+    print(f"{'depth':>6} {'lines':>7} {'best ms':>9} {'nodes':>6} {'links':>6}")
+    for depth in depths:
+        code = make_nested_module(depth)
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = generate_python_diagram(code, "nested.py")
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{depth:>6} {code.count(chr(10)):>7} {best * 1000:>9.2f} "
+              f"{len(result['nodes']):>6} {len(result['links']):>6}")
+
+if __name__ == "__main__":
+    run()
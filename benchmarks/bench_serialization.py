@@ -0,0 +1,89 @@
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "src"))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from bench_generators import SYNTHETIC, make_synthetic
+from code_parser import orjson, parse_code, write_json
+
+PARSE_SCRIPT = os.path.join(BENCHMARK_DIR, "json_parse.js")
+
+class NullBuffer(io.RawIOBase):
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return len(data)
+
+def print_dumps(diagram, stream):
+    # The CLI before the serialization layer: one string through text stdout.
+    text = io.TextIOWrapper(stream, encoding="utf-8", write_through=True)
+    print(json.dumps(diagram), file=text)
+    text.detach()
+
+def writers():
+    yield "json.dumps + print", print_dumps
+    yield "write_json", lambda diagram, stream: write_json(diagram, stream)
+    label = "write_json --compact" + (" (orjson)" if orjson is not None else "")
+    yield label, lambda diagram, stream: write_json(diagram, stream, compact=True)
+
+def time_writer(writer, diagram, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        writer(diagram, NullBuffer())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    writer(diagram, NullBuffer())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best * 1000, peak / 1024
+
+def time_node_parse(writer, diagram, repeat):
+    stream = io.BytesIO()
+    writer(diagram, stream)
+    try:
+        completed = subprocess.run(
+            ["node", PARSE_SCRIPT, str(repeat)],
+            input=stream.getvalue(),
+            capture_output=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None, len(stream.getvalue())
+    result = json.loads(completed.stdout)
+    return result["ms"], result["bytes"]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure writing parser output and parsing it again in Node.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="synthetic input sizes in lines")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case; the best one is reported")
+    parser.add_argument("--no-node", action="store_true", help="skip timing JSON.parse in Node")
+    args = parser.parse_args(argv)
+
+    print(f"{'case':<26} {'writer':<30} {'write ms':>9} {'peak KB':>9} {'MB':>7} {'JSON.parse ms':>14}")
+    for language, block in SYNTHETIC:
+        for size in args.sizes:
+            name = f"{language}/synthetic-{size}"
+            diagram = parse_code(make_synthetic(block, size), language, name)
+            for label, writer in writers():
+                write_ms, peak_kb = time_writer(writer, diagram, args.repeat)
+                parse_ms, size_bytes = (None, None) if args.no_node else time_node_parse(writer, diagram, args.repeat)
+                parse = f"{parse_ms:.2f}" if parse_ms is not None else "n/a"
+                megabytes = f"{size_bytes / 1e6:.2f}" if size_bytes is not None else ""
+                print(f"{name:<26} {label:<30} {write_ms:>9.2f} {peak_kb:>9.0f} {megabytes:>7} {parse:>14}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
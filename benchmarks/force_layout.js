@@ -0,0 +1,41 @@
+// Runs the webview's force simulation headless so its cost can be compared
+// with the parser's precomputed layout. Reads a diagram as JSON on stdin and
+// prints the milliseconds needed for the simulation to settle.
+//
+// d3 7 ships as an ES module, so require('d3') fails. The UMD bundle the
+// webview loads is evaluated instead; its path is the first argument.
+const fs = require('fs');
+const path = require('path');
+
+const bundle = process.argv[2] || path.join(__dirname, '..', 'node_modules', 'd3', 'dist', 'd3.min.js');
+const d3 = {};
+new Function('exports', 'module', fs.readFileSync(bundle, 'utf8'))(d3, {});
+
+let input = '';
+process.stdin.on('data', (chunk) => {
+    input += chunk;
+});
+process.stdin.on('end', () => {
+    const data = JSON.parse(input);
+    const width = 1200 * 3;
+    const height = 800 * 3;
+
+    const start = process.hrtime.bigint();
+    const simulation = d3.forceSimulation(data.nodes)
+        .force('link', d3.forceLink(data.links)
+            .id(d => d.id)
+            .distance(data.nodes.length > 10 ? 280 : 220))
+        .force('charge', d3.forceManyBody()
+            .strength(data.nodes.length > 10 ? -3200 : -2500))
+        .force('center', d3.forceCenter(width / 2, height / 2))
+        .force('collision', d3.forceCollide().radius(140))
+        .force('x', d3.forceX(width / 2).strength(0.02))
+        .force('y', d3.forceY(height / 2).strength(0.02))
+        .stop();
+
+    const ticks = Math.ceil(Math.log(simulation.alphaMin()) / Math.log(1 - simulation.alphaDecay()));
+    simulation.tick(ticks);
+    const elapsed = Number(process.hrtime.bigint() - start) / 1e6;
+
+    process.stdout.write(JSON.stringify({ ms: elapsed, ticks }) + '\n');
+});
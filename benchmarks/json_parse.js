@@ -0,0 +1,17 @@
+// Times the extension side of a parser response: reads a diagram as JSON on
+// stdin and prints the milliseconds JSON.parse needs for it.
+let input = '';
+process.stdin.setEncoding('utf8');
+process.stdin.on('data', (chunk) => {
+    input += chunk;
+});
+process.stdin.on('end', () => {
+    const repeat = Number(process.argv[2] || 3);
+    let best = Infinity;
+    for (let i = 0; i < repeat; i++) {
+        const start = process.hrtime.bigint();
+        JSON.parse(input);
+        best = Math.min(best, Number(process.hrtime.bigint() - start) / 1e6);
+    }
+    process.stdout.write(JSON.stringify({ ms: best, bytes: Buffer.byteLength(input) }) + '\n');
+});
@@ -3,46 +3,708 @@ import json
 import sys
 import re
 import os
+import hashlib
+import bisect
+import argparse
+import fnmatch
+import functools
+import heapq
+import itertools
+import concurrent.futures
+import contextlib
+import cProfile
+import time
+import tracemalloc
+from array import array
+from collections import OrderedDict, deque
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PARSER_VERSION = "1.5.1"
+# Part of every cache key; bump it whenever cached results change shape or
+# the links and details produced for the same source change.
+CACHE_SCHEMA = 8
+
+class ResultCache:
+    def __init__(self, max_entries=128, cache_dir=None, max_disk_entries=2048):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_disk_entries = max_disk_entries
+        self.disk_entries = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, code, language, root_label, options=""):
+        code_hash = hashlib.sha256(code.encode("utf-8", "surrogatepass")).hexdigest()
+        parts = [code_hash, language or "", root_label or "", PARSER_VERSION, str(CACHE_SCHEMA), options]
+        return hashlib.sha256("\0".join(parts).encode("utf-8", "surrogatepass")).hexdigest()
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        if self.cache_dir:
+            path = os.path.join(self.cache_dir, f"{key}.json")
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    result = json.load(f)
+                os.utime(path)
+            except (OSError, ValueError):
+                result = None
+            if result is not None:
+                self._remember(key, result)
+                self.hits += 1
+                return result
+
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        self._remember(key, result)
+
+        if self.cache_dir:
+            path = os.path.join(self.cache_dir, f"{key}.json")
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(result, f)
+                os.replace(temp_path, path)
+            except OSError:
+                return
+            self._prune_disk()
+
+    def _prune_disk(self):
+        # Files are dropped oldest first, and get() touches the ones it reads,
+        # so the directory keeps the most recently used results. Pruning goes
+        # a tenth below the limit so the directory is not listed on every put.
+        if self.disk_entries is not None:
+            self.disk_entries += 1
+            if self.disk_entries <= self.max_disk_entries:
+                return
 
-def parse_code(code, language, filename=None):
-    try:
-        root_label = filename or "Code Structure"
+        files = []
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".json"):
+                        try:
+                            files.append((entry.stat().st_mtime, entry.path))
+                        except OSError:
+                            pass
+        except OSError:
+            return
+
+        self.disk_entries = len(files)
+        if len(files) <= self.max_disk_entries:
+            return
+        files.sort()
+        for _, path in files[:len(files) - self.max_disk_entries * 9 // 10]:
+            try:
+                os.remove(path)
+                self.disk_entries -= 1
+            except OSError:
+                pass
+
+    def _remember(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+class ParseMetrics:
+    def __init__(self, enabled=True, trace_allocations=False):
+        self.enabled = enabled
+        self.trace_allocations = trace_allocations
+        self.phases = OrderedDict()
+        self.allocations = OrderedDict()
+        self.counts = OrderedDict()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        tracing = self.trace_allocations and tracemalloc.is_tracing()
+        if tracing:
+            memory_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                previous = self.allocations.get(name, {"net_kb": 0.0, "peak_kb": 0.0})
+                self.allocations[name] = {
+                    "net_kb": previous["net_kb"] + (current - memory_start) / 1024,
+                    "peak_kb": max(previous["peak_kb"], (peak - memory_start) / 1024),
+                }
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def as_dict(self):
+        metrics = {
+            "phases_ms": {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()},
+            "counts": dict(self.counts),
+        }
+        if self.allocations:
+            metrics["allocations"] = {
+                name: {key: round(value, 1) for key, value in values.items()}
+                for name, values in self.allocations.items()
+            }
+        return metrics
+
+NO_METRICS = ParseMetrics(enabled=False)
+
+def parse_code(code, language, filename=None, cache=None, profile=False, profile_path=None, output_format="json",
+               lazy=False, max_nodes=None, max_depth=None, expand=None, layout=False, workers=None, validation="auto"):
+    if output_format == "mermaid":
+        result = parse_code(
+            code, language, filename, cache, profile, profile_path, mermaid_graph_format(max_nodes, max_depth), lazy,
+            max_nodes, max_depth, expand, False, workers, validation,
+        )
+        if "error" in result:
+            return result
+        diagram = {"mermaid": "".join(iter_mermaid(result))}
+        if "metrics" in result:
+            diagram["metrics"] = result["metrics"]
+        return diagram
+
+    root_label = filename or "Code Structure"
+    result = load_diagram(
+        code, language, root_label, cache, profile, profile_path, output_format, lazy, workers, validation
+    )
+
+    if (max_nodes is not None or max_depth is not None or layout) and "error" not in result:
+        if output_format != "json":
+            return {"error": "Node budgets and layouts need the json output format"}
+        result = summarize_diagram(result, max_nodes, max_depth, expand)
+        if layout:
+            result = layout_diagram(result)
+    return result
+
+def load_diagram(code, language, root_label, cache=None, profile=False, profile_path=None, output_format="json",
+                 lazy=False, workers=None, validation="auto"):
+    if profile or profile_path:
+        return profile_diagram(
+            code, language, root_label, profile, profile_path, output_format, lazy, workers, validation
+        )
+
+    if cache is None:
+        return build_diagram(
+            code, language, root_label, output_format=output_format, lazy=lazy, workers=workers, validation=validation
+        )
+
+    key = cache.make_key(code, language, root_label, f"{output_format}:lazy" if lazy else output_format)
+    result = cache.get(key)
+    if result is None:
+        result = build_diagram(
+            code, language, root_label, output_format=output_format, lazy=lazy, workers=workers, validation=validation
+        )
+        if "error" not in result:
+            cache.put(key, result)
+    return result
+
+def profile_diagram(code, language, root_label, profile=True, profile_path=None, output_format="json", lazy=False,
+                    workers=None, validation="auto"):
+    trace_allocations = profile == "memory"
+    metrics = ParseMetrics(trace_allocations=trace_allocations)
+    started_tracing = trace_allocations and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if profile_path else None
 
+    try:
+        if profiler:
+            profiler.enable()
+        with metrics.phase("total"):
+            result = build_diagram(code, language, root_label, metrics, output_format, lazy, workers, validation)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        if started_tracing:
+            tracemalloc.stop()
+
+    if "error" not in result:
+        node_count, link_count = diagram_size(result)
+        metrics.count("nodes", node_count)
+        metrics.count("links", link_count)
+    result["metrics"] = metrics.as_dict()
+    return result
+
+def build_diagram(code, language, root_label, metrics=None, output_format="json", lazy=False, workers=None,
+                  validation="auto"):
+    metrics = metrics or NO_METRICS
+    try:
         if language == "python":
-            result = generate_python_diagram(code, root_label)
+            result = generate_python_diagram(
+                code, root_label, metrics=metrics, output_format=output_format, lazy=lazy, workers=workers
+            )
         elif language in ["javascript", "typescript", "javascriptreact", "typescriptreact", "jsx", "tsx"]:
-            result = generate_js_ts_diagram(code, language, root_label)
+            result = generate_js_ts_diagram(code, language, root_label, metrics=metrics, output_format=output_format)
         elif language in ["cpp", "c"]:
-            result = generate_cpp_diagram(code, root_label)
+            result = generate_cpp_diagram(code, root_label, metrics=metrics, output_format=output_format)
         else:
-            result = generate_js_ts_diagram(code, language, root_label)
+            result = generate_js_ts_diagram(code, language, root_label, metrics=metrics, output_format=output_format)
 
-        if not isinstance(result, dict):
-            return {"error": "Invalid result format"}
-        if "error" in result:
+        if validation == "off":
             return result
-        if not all(key in result for key in ["nodes", "links"]):
-            return {"error": "Missing required fields in result"}
+        # Every generator builds through DiagramGraph, which hands out unique
+        # ids and stores links by node index, so "auto" only checks the
+        # shape of the result; "full" re-checks the whole graph in bulk.
+        with metrics.phase("validation"):
+            return validate_diagram(result, full=validation == "full")
+    except Exception as e:
+        return {"error": f"Error parsing code: {str(e)}"}
+
+def diagram_size(result):
+    if result.get("format") == "columnar":
+        return len(result["nodes"]["node"]), len(result["links"]["source"])
+    return len(result["nodes"]), len(result["links"])
+
+def contains_tree(links):
+    parents = {}
+    children = {}
+    for link in links:
+        if link["type"] == "contains" and link["target"] not in parents:
+            parents[link["target"]] = link["source"]
+            children.setdefault(link["source"], []).append(link["target"])
+    return parents, children
+
+def summarize_diagram(result, max_nodes=None, max_depth=None, expand=None):
+    nodes = result["nodes"]
+    links = result["links"]
+    if max_depth is None and (not max_nodes or len(nodes) <= max_nodes):
+        return result
+    expanded = set(expand or ())
+    parents, children = contains_tree(links)
+
+    entries = {}
+    types = {}
+    for node in nodes:
+        entries[node["id"]] = entries.get(node["id"], 0) + 1
+        types.setdefault(node["id"], node["type"])
+
+    order = [node_id for node_id in entries if node_id not in parents]
+    depth = dict.fromkeys(order, 0)
+    for node_id in order:
+        for child in children.get(node_id, ()):
+            if child not in depth:
+                depth[child] = depth[node_id] + 1
+                order.append(child)
+
+    size = {}
+    for node_id in reversed(order):
+        size[node_id] = entries.get(node_id, 0) + sum(size.get(child, 0) for child in children.get(node_id, ()))
+
+    hidden = set()
+    collapsed = {}
+
+    def collapse(node_id):
+        collapsed[node_id] = 0
+        stack = list(children.get(node_id, ()))
+        while stack:
+            child = stack.pop()
+            if child in hidden:
+                continue
+            hidden.add(child)
+            collapsed[node_id] += entries.get(child, 0)
+            stack.extend(children.get(child, ()))
+        return collapsed[node_id]
+
+    # Containers are folded outermost and largest first: anything past
+    # max_depth, then as many as the node budget needs. Ids listed in
+    # expand stay open so a client can drill into one part of the graph.
+    visible = len(nodes)
+    if max_depth is not None:
+        for node_id in order:
+            if node_id not in hidden and depth[node_id] >= max_depth and children.get(node_id) and node_id not in expanded:
+                visible -= collapse(node_id)
+
+    if max_nodes and visible > max_nodes:
+        candidates = [node_id for node_id in order if depth[node_id] > 0 and children.get(node_id) and node_id not in expanded]
+        candidates.sort(key=lambda node_id: -size[node_id])
+        for node_id in candidates:
+            if visible <= max_nodes:
+                break
+            if node_id not in hidden and node_id not in collapsed:
+                visible -= collapse(node_id)
+
+    def representative(node_id):
+        while node_id in hidden:
+            node_id = parents[node_id]
+        return node_id
+
+    # Still over budget: leaves and folded containers under the same parent
+    # are grouped by type, largest groups first. Only as many members as the
+    # budget needs go into the group node, least connected first, so the
+    # rest of the siblings and their call links stay visible.
+    groups = {}
+    if max_nodes and visible > max_nodes:
+        members = {}
+        for node_id in order:
+            parent = parents.get(node_id)
+            if (parent is None or node_id in hidden or node_id in expanded
+                    or (children.get(node_id) and node_id not in collapsed)):
+                continue
+            members.setdefault((parent, types[node_id]), []).append(node_id)
+
+        degree = {}
+        for link in links:
+            if link["type"] != "contains":
+                for end in (representative(link["source"]), representative(link["target"])):
+                    degree[end] = degree.get(end, 0) + 1
+
+        for (parent, node_type), group in sorted(members.items(), key=lambda item: -len(item[1])):
+            group_id = f"{parent}/{node_type}"
+            if visible <= max_nodes:
+                break
+            if len(group) < 2 or group_id in expanded:
+                continue
+            group.sort(key=lambda node_id: degree.get(node_id, 0))
+            folded = []
+            saved = -1
+            for node_id in group:
+                if visible - saved <= max_nodes and len(folded) >= 2:
+                    break
+                folded.append(node_id)
+                saved += entries[node_id]
+            count = sum(entries[node_id] + collapsed.get(node_id, 0) for node_id in folded)
+            groups[group_id] = (parent, node_type, saved + 1, count)
+            for node_id in folded:
+                hidden.add(node_id)
+                parents[node_id] = group_id
+            visible -= saved
+
+    summarized_nodes = []
+    placed_groups = set()
+    for node in nodes:
+        node_id = node["id"]
+        if node_id in hidden:
+            group_id = parents[node_id]
+            if group_id in groups and group_id not in placed_groups:
+                placed_groups.add(group_id)
+                _, node_type, folded, count = groups[group_id]
+                colors = get_colors(node_type)
+                summarized_nodes.append({
+                    "id": group_id,
+                    "name": f"{folded} {node_type} nodes",
+                    "type": node_type,
+                    "color": colors["fill"],
+                    "textColor": colors["text"],
+                    "details": f"{folded} {node_type} nodes folded together",
+                    "collapsed": True,
+                    "hiddenNodes": count
+                })
+            continue
+        if node_id in collapsed:
+            node = dict(node, collapsed=True, hiddenNodes=collapsed[node_id])
+        summarized_nodes.append(node)
+
+    summarized_links = []
+    weights = {}
+    for link in links:
+        if link["type"] == "contains":
+            if link["source"] not in collapsed and link["source"] not in hidden and link["target"] not in hidden:
+                summarized_links.append(link)
+            continue
+        source = representative(link["source"])
+        target = representative(link["target"])
+        if source == target and source != link["source"]:
+            continue
+        key = (source, target, link["type"])
+        if key in weights:
+            weights[key]["weight"] += 1
+        else:
+            weights[key] = {"source": source, "target": target, "type": link["type"], "weight": 1}
+            summarized_links.append(weights[key])
+    for group_id, (parent, _, _, _) in groups.items():
+        summarized_links.append({"source": parent, "target": group_id, "type": "contains"})
+
+    summary = dict(result, nodes=summarized_nodes, links=summarized_links)
+    summary["summary"] = {
+        "totalNodes": len(nodes),
+        "visibleNodes": len(summarized_nodes),
+        "collapsedNodes": sum(1 for node_id in collapsed if node_id not in hidden) + len(groups)
+    }
+    return summary
+
+NUMPY_LAYOUT_MIN_NODES = 1000
+
+@functools.lru_cache(maxsize=None)
+def load_numpy():
+    # Imported on first use: numpy adds about 100 ms to start-up, which
+    # every one-shot run and pool process would pay without --layout.
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def estimate_node_width(name):
+    return max(100, len(name) * 7 + 60)
+
+def layout_diagram(result, layer_gap=160, node_gap=40):
+    nodes = result["nodes"]
+    links = result["links"]
+    parents, children = contains_tree(links)
+
+    names = {}
+    for node in nodes:
+        names.setdefault(node["id"], node["name"])
+    roots = [node_id for node_id in names if parents.get(node_id) not in names]
+
+    def preorder():
+        order = []
+        depth = {}
+        stack = [(node_id, 0) for node_id in reversed(roots)]
+        while stack:
+            node_id, level = stack.pop()
+            if node_id in depth:
+                continue
+            depth[node_id] = level
+            order.append(node_id)
+            stack.extend((child, level + 1) for child in reversed(children.get(node_id, ())))
+        return order, depth
+
+    # Layers follow the contains tree, which a preorder walk already lays
+    # out without crossings. Call edges are only used afterwards to pull
+    # siblings towards the nodes they call, by barycenter of position.
+    order, depth = preorder()
+    position = {node_id: index for index, node_id in enumerate(order)}
+    neighbours = {}
+    for link in links:
+        if link["type"] != "contains" and link["source"] in position and link["target"] in position:
+            neighbours.setdefault(link["source"], []).append(position[link["target"]])
+            neighbours.setdefault(link["target"], []).append(position[link["source"]])
+
+    def barycenter(node_id):
+        linked = neighbours.get(node_id)
+        return sum(linked) / len(linked) if linked else position[node_id]
+
+    for parent, siblings in children.items():
+        if len(siblings) > 1:
+            siblings.sort(key=barycenter)
+    order, depth = preorder()
+
+    position = {node_id: index for index, node_id in enumerate(order)}
+    widths = [estimate_node_width(names[node_id]) for node_id in order]
+    parent_index = [position.get(parents.get(node_id), -1) if depth[node_id] else -1 for node_id in order]
+    levels = [depth[node_id] for node_id in order]
+
+    if len(order) >= NUMPY_LAYOUT_MIN_NODES and load_numpy() is not None:
+        xs = layout_columns_numpy(widths, parent_index, levels, node_gap)
+        engine = "numpy"
+    else:
+        xs = layout_columns(widths, parent_index, levels, node_gap)
+        engine = "python"
+
+    positions = {node_id: (round(float(x), 1), levels[index] * layer_gap) for index, (node_id, x) in enumerate(zip(order, xs))}
+    placed = [dict(node, x=positions[node["id"]][0], y=positions[node["id"]][1]) for node in nodes]
+
+    laid_out = dict(result, nodes=placed)
+    laid_out["layout"] = {
+        "engine": engine,
+        "width": max((x for x, _ in positions.values()), default=0) + node_gap,
+        "height": max((y for _, y in positions.values()), default=0) + layer_gap
+    }
+    return laid_out
+
+def layout_columns(widths, parent_index, levels, node_gap):
+    # Every subtree gets a span as wide as its own node or the sum of its
+    # children, whichever is larger. Children are then centred inside the
+    # span of their parent, so no two subtrees overlap within a layer.
+    count = len(widths)
+    spans = [width + node_gap for width in widths]
+    child_total = [0.0] * count
+    for index in sorted(range(count), key=lambda index: -levels[index]):
+        spans[index] = max(spans[index], child_total[index])
+        parent = parent_index[index]
+        if parent >= 0:
+            child_total[parent] += spans[index]
+
+    left = [0.0] * count
+    used = [0.0] * count
+    root_cursor = 0.0
+    for index in range(count):
+        parent = parent_index[index]
+        if parent < 0:
+            left[index] = root_cursor
+            root_cursor += spans[index]
+        else:
+            left[index] = left[parent] + (spans[parent] - child_total[parent]) / 2 + used[parent]
+            used[parent] += spans[index]
+    return [left[index] + spans[index] / 2 for index in range(count)]
+
+def layout_columns_numpy(widths, parent_index, levels, node_gap):
+    np = load_numpy()
+    spans = np.asarray(widths, dtype=float) + node_gap
+    parent_index = np.asarray(parent_index)
+    levels = np.asarray(levels)
+    layers = [np.flatnonzero(levels == level) for level in range(int(levels.max()) + 1)]
+
+    child_total = np.zeros(len(spans))
+    for layer in reversed(layers):
+        spans[layer] = np.maximum(spans[layer], child_total[layer])
+        linked = layer[parent_index[layer] >= 0]
+        np.add.at(child_total, parent_index[linked], spans[linked])
+
+    # A layer lists nodes in preorder, so the children of one parent form a
+    # contiguous run and their offsets are a cumulative sum restarted per run.
+    left = np.zeros(len(spans))
+    roots = np.flatnonzero(parent_index < 0)
+    left[roots] = np.cumsum(spans[roots]) - spans[roots]
+    for layer in layers[1:]:
+        parents = parent_index[layer]
+        before = np.cumsum(spans[layer]) - spans[layer]
+        starts = np.r_[True, parents[1:] != parents[:-1]]
+        run_start = np.maximum.accumulate(np.where(starts, np.arange(len(layer)), 0))
+        offset = before - before[run_start]
+        left[layer] = left[parents] + (spans[parents] - child_total[parents]) / 2 + offset
+    return left + spans / 2
+
+VALIDATION_MODES = ("auto", "full", "off")
+NODE_FIELDS = frozenset(["id", "name", "type", "color"])
+LINK_FIELDS = frozenset(["source", "target"])
+COLUMNAR_NODE_FIELDS = ("node", "type", "details")
+COLUMNAR_LINK_FIELDS = ("source", "target", "type")
+
+def validate_diagram(result, full=True):
+    if not isinstance(result, dict):
+        return {"error": "Invalid result format"}
+    if "error" in result:
+        return result
+    if not all(key in result for key in ["nodes", "links"]):
+        return {"error": "Missing required fields in result"}
+    if result.get("format") == "columnar":
+        if not isinstance(result["nodes"], dict) or not isinstance(result["links"], dict):
+            return {"error": "Invalid data structure"}
+        if not result["nodes"].get("node"):
+            return {"error": "No code structure detected"}
+        error = check_columnar_graph(result) if full else None
+    else:
         if not isinstance(result["nodes"], list) or not isinstance(result["links"], list):
             return {"error": "Invalid data structure"}
         if not result["nodes"]:
             return {"error": "No code structure detected"}
+        error = check_graph(result["nodes"], result["links"]) if full else None
+    return {"error": error} if error else result
+
+def check_graph(nodes, links):
+    invalid = next((node for node in nodes if not NODE_FIELDS <= node.keys()), None)
+    if invalid is not None:
+        return f"Invalid node structure: {invalid}"
+    invalid = next((link for link in links if not LINK_FIELDS <= link.keys()), None)
+    if invalid is not None:
+        return f"Invalid link structure: {invalid}"
+
+    ids = [node["id"] for node in nodes]
+    known = set(ids)
+    if len(known) != len(ids):
+        seen = set()
+        duplicates = sorted({node_id for node_id in ids if node_id in seen or seen.add(node_id)})
+        return f"Duplicate node ids: {duplicates[:5]}"
+
+    endpoints = {link["source"] for link in links}
+    endpoints.update(link["target"] for link in links)
+    dangling = endpoints - known
+    if dangling:
+        return f"Links to unknown nodes: {sorted(dangling, key=str)[:5]}"
+    return None
 
-        for node in result["nodes"]:
-            if not all(key in node for key in ["id", "name", "type", "color"]):
-                return {"error": f"Invalid node structure: {node}"}
+def check_columnar_graph(result):
+    ids = result.get("ids")
+    types = result.get("types")
+    link_types = result.get("linkTypes")
+    if not isinstance(ids, list) or not isinstance(types, list) or not isinstance(link_types, list):
+        return "Missing required fields in result"
+    nodes = result["nodes"]
+    links = result["links"]
+    if any(not isinstance(nodes.get(field), list) for field in COLUMNAR_NODE_FIELDS):
+        return "Invalid node columns"
+    if any(not isinstance(links.get(field), list) for field in COLUMNAR_LINK_FIELDS):
+        return "Invalid link columns"
+    if len({len(nodes[field]) for field in COLUMNAR_NODE_FIELDS}) != 1:
+        return "Node columns differ in length"
+    if len({len(links[field]) for field in COLUMNAR_LINK_FIELDS}) != 1:
+        return "Link columns differ in length"
+    if len(set(ids)) != len(ids):
+        return "Duplicate node ids"
+
+    def out_of_range(column, size):
+        return column and (min(column) < 0 or max(column) >= size)
+
+    if out_of_range(nodes["node"], len(ids)) or out_of_range(nodes["type"], len(types)):
+        return "Node entries point outside the id or type tables"
+    if out_of_range(links["source"], len(ids)) or out_of_range(links["target"], len(ids)):
+        return "Links to unknown nodes"
+    if out_of_range(links["type"], len(link_types)):
+        return "Link entries point outside the link type table"
+    return None
 
-        for link in result["links"]:
-            if not all(key in link for key in ["source", "target"]):
-                return {"error": f"Invalid link structure: {link}"}
+def stream_diagram(code, language, root_label, emit):
+    counts = {"node": 0, "link": 0}
 
-        return result
+    def counted_emit(kind, record):
+        counts[kind] += 1
+        emit(kind, record)
+
+    try:
+        if language == "python":
+            result = generate_python_diagram(code, root_label, counted_emit)
+        elif language in ["cpp", "c"]:
+            result = generate_cpp_diagram(code, root_label, counted_emit)
+        else:
+            result = generate_js_ts_diagram(code, language, root_label, counted_emit)
     except Exception as e:
-        return {"error": f"Error parsing code: {str(e)}"}
+        result = {"error": f"Error parsing code: {str(e)}"}
+
+    if "error" in result:
+        return {"error": result["error"]}
+    if not counts["node"]:
+        return {"error": "No code structure detected"}
+    return {"summary": {"nodes": counts["node"], "links": counts["link"]}}
+
+def stream_code(code, language, filename=None, write=None, compact=False):
+    write = write or sys.stdout.write
+
+    def emit(kind, record):
+        write(json_text({kind: record}, compact) + "\n")
+
+    summary = stream_diagram(code, language, filename or "Code Structure", emit)
+    write(json_text(summary, compact) + "\n")
+    return summary
+
+PYTHON_DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+# Statements whose bodies still belong to the enclosing definition, so a def
+# under an if/try/with inside a class or function is a child of that scope.
+PYTHON_BLOCKS = tuple(
+    getattr(ast, name) for name in (
+        "If", "For", "AsyncFor", "While", "With", "AsyncWith", "Try", "TryStar", "ExceptHandler", "Match", "match_case",
+    )
+    if hasattr(ast, name)
+)
 
 def extract_docstring(node):
-    if isinstance(node, (ast.FunctionDef, ast.ClassDef)) and ast.get_docstring(node):
-        return ast.get_docstring(node)
+    if isinstance(node, PYTHON_DEFINITIONS):
+        return ast.get_docstring(node) or None
     return None
 
 def format_arguments(args):
@@ -70,369 +732,1930 @@ def get_colors(node_type):
         "Method": {"fill": "#0277BD", "text": "#FFFFFF"},
         "Component": {"fill": "#7C3AED", "text": "#FFFFFF"},
         "Import": {"fill": "#6D4C41", "text": "#FFFFFF"},
+        "Module": {"fill": "#00838F", "text": "#FFFFFF"},
         "Root": {"fill": "#37474F", "text": "#FFFFFF"},
     }
     return colors.get(node_type, {"fill": "#78909C", "text": "#FFFFFF"})
 
-def get_call_name(node):
+class DiagramGraph:
+    __slots__ = (
+        "emit", "dedupe_links", "types", "type_index", "type_colors", "link_types", "link_type_index",
+        "node_keys", "repeats", "ids", "names", "entry_nodes", "entry_types", "entry_details",
+        "link_sources", "link_targets", "link_kinds", "link_keys", "node_count", "link_count",
+    )
+
+    def __init__(self, emit=None, dedupe_links=True):
+        self.emit = emit
+        self.dedupe_links = dedupe_links
+        self.types = []
+        self.type_index = {}
+        self.type_colors = []
+        self.link_types = []
+        self.link_type_index = {}
+        self.node_keys = {}
+        self.repeats = {}
+        self.ids = []
+        self.names = []
+        self.entry_nodes = array("l")
+        self.entry_types = array("l")
+        self.entry_details = []
+        self.link_sources = array("l")
+        self.link_targets = array("l")
+        self.link_kinds = array("l")
+        self.link_keys = set()
+        self.node_count = 0
+        self.link_count = 0
+
+    def intern_type(self, node_type):
+        index = self.type_index.get(node_type)
+        if index is None:
+            index = len(self.types)
+            self.types.append(node_type)
+            self.type_index[node_type] = index
+            colors = get_colors(node_type)
+            self.type_colors.append((colors["fill"], colors["text"]))
+        return index
+
+    def intern_link_type(self, link_type):
+        index = self.link_type_index.get(link_type)
+        if index is None:
+            index = len(self.link_types)
+            self.link_types.append(link_type)
+            self.link_type_index[link_type] = index
+        return index
+
+    def node_index(self, node_type, name, parent=None):
+        # Ids are qualified by kind and by the enclosing node, e.g.
+        # "Class:Foo.Method:bar", so they survive edits elsewhere in the file.
+        # A repeated definition gets "#2", "#3", ... in source order.
+        if node_type == "Root":
+            node_id = "Root"
+        elif parent is None or self.ids[parent] == "Root":
+            node_id = f"{node_type}:{name}"
+        else:
+            node_id = f"{self.ids[parent]}.{node_type}:{name}"
+
+        if node_id in self.node_keys:
+            repeat = self.repeats.get(node_id, 1) + 1
+            self.repeats[node_id] = repeat
+            node_id = f"{node_id}#{repeat}"
+
+        index = len(self.ids)
+        self.node_keys[node_id] = index
+        self.ids.append(node_id)
+        self.names.append(name)
+        return index
+
+    def add_link(self, source, target, link_type="contains"):
+        if self.dedupe_links:
+            # A self "calls" link is direct recursion; any other self link
+            # carries nothing.
+            key = (source, target, link_type)
+            if (source == target and link_type != "calls") or key in self.link_keys:
+                return
+            self.link_keys.add(key)
+
+        self.link_count += 1
+        if self.emit:
+            self.emit("link", self.link_dict(source, target, link_type))
+            return
+        self.link_sources.append(source)
+        self.link_targets.append(target)
+        self.link_kinds.append(self.intern_link_type(link_type))
+
+    def add_node(self, name, node_type="", details="", parent=None):
+        index = self.node_index(node_type, name, parent)
+        type_index = self.intern_type(node_type)
+
+        self.node_count += 1
+        if self.emit:
+            self.emit("node", self.node_dict(index, type_index, details))
+        else:
+            self.entry_nodes.append(index)
+            self.entry_types.append(type_index)
+            self.entry_details.append(details)
+
+        if parent is not None:
+            self.add_link(parent, index, "contains")
+
+        return index
+
+    def node_dict(self, index, type_index, details):
+        fill, text = self.type_colors[type_index]
+        node = {
+            "id": self.ids[index],
+            "name": self.names[index],
+            "type": self.types[type_index],
+            "color": fill,
+            "textColor": text,
+        }
+        if details is not None:
+            node["details"] = details
+        return node
+
+    def link_dict(self, source, target, link_type):
+        return {"source": self.ids[source], "target": self.ids[target], "type": link_type}
+
+    def to_dict(self):
+        nodes = [
+            self.node_dict(index, type_index, details)
+            for index, type_index, details in zip(self.entry_nodes, self.entry_types, self.entry_details)
+        ]
+        links = [
+            self.link_dict(source, target, self.link_types[kind])
+            for source, target, kind in zip(self.link_sources, self.link_targets, self.link_kinds)
+        ]
+        return {"nodes": nodes, "links": links}
+
+    def to_columnar(self):
+        return {
+            "format": "columnar",
+            "types": [
+                {"name": node_type, "color": fill, "textColor": text}
+                for node_type, (fill, text) in zip(self.types, self.type_colors)
+            ],
+            "ids": list(self.ids),
+            "names": list(self.names),
+            "nodes": {
+                "node": self.entry_nodes.tolist(),
+                "type": self.entry_types.tolist(),
+                "details": list(self.entry_details),
+            },
+            "linkTypes": list(self.link_types),
+            "links": {
+                "source": self.link_sources.tolist(),
+                "target": self.link_targets.tolist(),
+                "type": self.link_kinds.tolist(),
+            },
+        }
+
+    def to_output(self, output_format="json"):
+        if output_format == "columnar":
+            return self.to_columnar()
+        return self.to_dict()
+
+class SymbolTable:
+    __slots__ = ("kinds", "parents", "qualnames", "qualified", "by_name", "members", "bases", "imported")
+
+    def __init__(self):
+        self.imported = set()
+        self.kinds = {}
+        self.parents = {}
+        self.qualnames = {}
+        self.qualified = {}
+        self.by_name = {}
+        self.members = {None: {}}
+        self.bases = {}
+
+    def define(self, index, name, kind, scope=None, bases=None):
+        qualname = f"{self.qualnames[scope]}.{name}" if scope is not None else name
+        self.kinds[index] = kind
+        self.parents[index] = scope
+        self.qualnames[index] = qualname
+        self.qualified[qualname] = index
+        self.by_name.setdefault(name, []).append(index)
+        self.members.setdefault(scope, {})[name] = index
+        if bases:
+            self.bases[index] = bases
+
+    def enclosing_class(self, scope):
+        while scope is not None and self.kinds[scope] != "Class":
+            scope = self.parents[scope]
+        return scope
+
+    def find_member(self, class_index, name, depth=0):
+        found = self.members.get(class_index, {}).get(name)
+        if found is not None or depth > 8:
+            return found
+        for base in self.bases.get(class_index, ()):
+            base_index = self.qualified.get(base)
+            if base_index is not None and self.kinds[base_index] == "Class":
+                found = self.find_member(base_index, name, depth + 1)
+                if found is not None:
+                    return found
+        return None
+
+    def resolve(self, call_path, scope=None):
+        # self/cls/this calls look in the enclosing class and its bases; bare
+        # names follow Python lookup (enclosing functions, then the module,
+        # skipping class bodies); dotted paths match qualified names. An
+        # unknown receiver (UNKNOWN_RECEIVER) only trusts a name defined
+        # once, and names reached through an import are never guessed.
+        parts = call_path.split(".")
+        if parts[0] == UNKNOWN_RECEIVER:
+            pass
+        elif parts[0] in ("self", "cls", "this") and len(parts) == 2:
+            owner = self.enclosing_class(scope)
+            if owner is not None:
+                found = self.find_member(owner, parts[1])
+                if found is not None:
+                    return found
+        elif len(parts) == 1:
+            while scope is not None:
+                if self.kinds[scope] != "Class" and parts[0] in self.members.get(scope, {}):
+                    return self.members[scope][parts[0]]
+                scope = self.parents[scope]
+            if parts[0] in self.members[None]:
+                return self.members[None][parts[0]]
+        elif call_path in self.qualified:
+            return self.qualified[call_path]
+
+        if parts[0] in self.imported:
+            return None
+        candidates = self.by_name.get(parts[-1])
+        if candidates and len(candidates) == 1:
+            return candidates[0]
+        return None
+
+# Stands in for a receiver that is not a plain name, as in get_store().save()
+# or ", ".join(x); such calls must not resolve like the bare name.
+UNKNOWN_RECEIVER = "?"
+
+def get_call_path(node):
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
     if isinstance(node, ast.Name):
-        return node.id
-    if isinstance(node, ast.Attribute):
-        return node.attr
-    return None
+        parts.append(node.id)
+    elif parts:
+        return f"{UNKNOWN_RECEIVER}.{parts[0]}"
+    else:
+        return None
+    return ".".join(reversed(parts))
+
+REACT_MARKUP = re.compile(r'return\s*\(\s*\n?\s*<|return\s+<|<(?:div|span|button)\b|<\s*[A-Z][a-zA-Z0-9]*')
 
 def is_react_component(body_text):
-    if re.search(r'return\s*\(\s*\n?\s*<', body_text):
-        return True
-    if re.search(r'return\s+<', body_text):
-        return True
-    if re.search(r'<(div|span|button)\b', body_text):
-        return True
-    if re.search(r'<\s*[A-Z][a-zA-Z0-9]*', body_text):
-        return True
-    return False
-
-def extract_braced_body(code, start_pos):
-    brace_start = code.find('{', start_pos)
-    if brace_start == -1:
-        arrow = code.find('=>', start_pos)
-        if arrow == -1:
-            return ''
-        end = code.find('\n', arrow)
-        return code[arrow:end if end != -1 else len(code)]
-    depth = 0
-    for i in range(brace_start, len(code)):
-        if code[i] == '{':
-            depth += 1
-        elif code[i] == '}':
-            depth -= 1
-            if depth == 0:
-                return code[brace_start:i + 1]
-    return code[brace_start:]
-
-def generate_python_diagram(code, root_label="Code Structure"):
-    try:
-        tree = ast.parse(code)
-        nodes = []
-        links = []
-        node_ids = {}
-        link_keys = set()
-        counter = [0]
-        function_records = []
-
-        def get_node_id(name):
-            if name not in node_ids:
-                node_ids[name] = f"node{counter[0]}"
-                counter[0] += 1
-            return node_ids[name]
-
-        def add_link(source, target, link_type="contains"):
-            key = (source, target, link_type)
-            if source == target or key in link_keys:
-                return
-            link_keys.add(key)
-            links.append({"source": source, "target": target, "type": link_type})
+    return REACT_MARKUP.search(body_text) is not None
+
+BRACE_CODE_TOKENS = re.compile(r'//[^\n]*|/\*[\s\S]*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|[{}`]')
+BRACE_TEMPLATE_TOKENS = re.compile(r'\\[\s\S]|\$\{|`')
+WHITESPACE = re.compile(r'\s*')
+
+class BraceIndex:
+    def __init__(self, code):
+        self.length = len(code)
+        self.pairs = {}
+        self.opens = []
+
+        # Template literal substitutions push a None marker so the "}" that
+        # closes "${" drops back into template text instead of pairing.
+        stack = []
+        in_template = False
+        pos = 0
+        while pos < self.length:
+            if in_template:
+                match = BRACE_TEMPLATE_TOKENS.search(code, pos)
+                if not match:
+                    break
+                pos = match.end()
+                token = match.group()
+                if token == "`":
+                    in_template = False
+                elif token == "${":
+                    stack.append(None)
+                    in_template = False
+                continue
+
+            match = BRACE_CODE_TOKENS.search(code, pos)
+            if not match:
+                break
+            pos = match.end()
+            token = match.group()
+            if token == "{":
+                self.opens.append(match.start())
+                stack.append(match.start())
+            elif token == "}":
+                if stack:
+                    open_pos = stack.pop()
+                    if open_pos is None:
+                        in_template = True
+                    else:
+                        self.pairs[open_pos] = match.start()
+            elif token == "`":
+                in_template = True
+
+        for open_pos in stack:
+            if open_pos is not None:
+                self.pairs[open_pos] = self.length - 1
+
+    def find_open(self, start_pos, end_pos=None):
+        index = bisect.bisect_left(self.opens, start_pos)
+        if index == len(self.opens):
+            return None
+        open_pos = self.opens[index]
+        if end_pos is not None and open_pos >= end_pos:
+            return None
+        return open_pos
+
+    def close(self, open_pos):
+        return self.pairs.get(open_pos, open_pos)
+
+def find_body_span(code, start_pos, braces):
+    pos = WHITESPACE.match(code, start_pos).end()
+    if code.startswith('=>', pos):
+        arrow = pos
+        pos = WHITESPACE.match(code, pos + 2).end()
+        if not code.startswith('{', pos):
+            end = code.find('\n', arrow)
+            return arrow, end if end != -1 else len(code)
+    if code.startswith('{', pos):
+        return pos, braces.close(pos) + 1
+    return None
 
-        def add_node(name, node_type="", details="", parent=None):
-            node_id = get_node_id(name)
-            colors = get_colors(node_type)
+def extract_braced_body(code, start_pos, braces=None):
+    span = find_body_span(code, start_pos, braces or BraceIndex(code))
+    if span is None:
+        return ''
+    return code[span[0]:span[1]]
+
+def assigned_lambda(node):
+    if isinstance(node, ast.Assign) and len(node.targets) == 1:
+        target = node.targets[0]
+    elif isinstance(node, ast.AnnAssign) and node.value is not None:
+        target = node.target
+    else:
+        return None
+    if isinstance(target, ast.Name) and isinstance(node.value, ast.Lambda):
+        return target.id
+    return None
 
-            nodes.append({
-                "id": node_id,
-                "name": name,
-                "type": node_type,
-                "color": colors["fill"],
-                "textColor": colors["text"],
-                "details": details
-            })
-
-            if parent:
-                add_link(parent, node_id, "contains")
-
-            return node_id
-
-        def process_node(node, parent_id=None):
-            if isinstance(node, ast.FunctionDef):
-                args_str = format_arguments(node.args)
-                docstring = extract_docstring(node)
-                details = f"Parameters: ({args_str})"
-                if docstring:
-                    details += f"\\nDescription: {docstring.split('.')[0]}"
-
-                node_type = "Method" if parent_id else "Function"
-                node_id = add_node(node.name, node_type, details, parent_id)
-                function_records.append((node_id, node))
-
-                for child in ast.iter_child_nodes(node):
-                    if isinstance(child, (ast.FunctionDef, ast.ClassDef)):
-                        process_node(child, node_id)
-
-            elif isinstance(node, ast.ClassDef):
-                bases = [b.id for b in node.bases if isinstance(b, ast.Name)]
-                docstring = extract_docstring(node)
-                details = ""
-                if bases:
-                    details += f"Inherits from: {', '.join(bases)}\\n"
-                if docstring:
-                    details += f"Description: {docstring.split('.')[0]}"
-
-                node_id = add_node(node.name, "Class", details, parent_id)
-
-                for child in ast.iter_child_nodes(node):
-                    if isinstance(child, (ast.FunctionDef, ast.ClassDef)):
-                        process_node(child, node_id)
-
-            elif isinstance(node, (ast.Import, ast.ImportFrom)):
-                names = []
-                if isinstance(node, ast.Import):
-                    names = [n.name for n in node.names]
-                else:
-                    module = node.module or ""
-                    names = [f"{module}.{n.name}" for n in node.names]
-                add_node(', '.join(names), "Import", "External dependency", parent_id)
+def decorator_names(node):
+    names = []
+    for decorator in getattr(node, "decorator_list", ()):
+        name = get_call_path(decorator.func if isinstance(decorator, ast.Call) else decorator)
+        if name:
+            names.append(name)
+    return names
+
+def python_details(node):
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        args_str = format_arguments(node.args)
+        docstring = extract_docstring(node)
+        details = f"Parameters: ({args_str})"
+        if isinstance(node, ast.AsyncFunctionDef):
+            details = f"Async function\\n{details}"
+        decorators = decorator_names(node)
+        if decorators:
+            details += f"\\nDecorators: {', '.join('@' + name for name in decorators)}"
+        if docstring:
+            details += f"\\nDescription: {docstring.split('.')[0]}"
+        return details
+
+    if isinstance(node, ast.ClassDef):
+        bases = [b.id for b in node.bases if isinstance(b, ast.Name)]
+        docstring = extract_docstring(node)
+        details = ""
+        if bases:
+            details += f"Inherits from: {', '.join(bases)}\\n"
+        decorators = decorator_names(node)
+        if decorators:
+            details += f"Decorators: {', '.join('@' + name for name in decorators)}\\n"
+        if docstring:
+            details += f"Description: {docstring.split('.')[0]}"
+        return details
+
+    if assigned_lambda(node):
+        return f"Lambda\\nParameters: ({format_arguments(node.value.args)})"
 
-        root_id = add_node(root_label, "Root", "Main program structure")
+    return None
 
-        for node in ast.iter_child_nodes(tree):
-            if isinstance(node, (ast.Import, ast.ImportFrom)):
-                process_node(node, root_id)
+def make_python_record(node, lazy=False):
+    name = node.name if isinstance(node, PYTHON_DEFINITIONS) else assigned_lambda(node)
+    if name:
+        kind = "Class" if isinstance(node, ast.ClassDef) else "Function"
+        # Decorators become "decorates" links to the definition they wrap;
+        # they run in the enclosing scope, so they are not calls it makes.
+        record = {
+            "kind": kind, "name": name, "details": None, "calls": [], "children": [],
+            "decorators": decorator_names(node),
+        }
+        if kind == "Class":
+            record["bases"] = [b.id for b in node.bases if isinstance(b, ast.Name)]
+        if lazy:
+            record["node"] = node
+        else:
+            record["details"] = python_details(node)
+        return record
 
-        for node in ast.iter_child_nodes(tree):
-            if isinstance(node, ast.ClassDef):
-                process_node(node, root_id)
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        if isinstance(node, ast.Import):
+            names = [n.name for n in node.names]
+        else:
+            module = node.module or ""
+            names = [f"{module}.{n.name}" for n in node.names]
+
+        aliases = [
+            alias.asname or (alias.name if isinstance(node, ast.ImportFrom) else alias.name.split(".")[0])
+            for alias in node.names
+        ]
+        return {
+            "kind": "Import", "name": ', '.join(names), "details": "External dependency", "calls": [], "children": [],
+            "aliases": aliases,
+        }
 
-        for node in ast.iter_child_nodes(tree):
-            if isinstance(node, ast.FunctionDef):
-                process_node(node, root_id)
+    return None
 
-        for caller_id, func_node in function_records:
-            for child in ast.walk(func_node):
-                if isinstance(child, ast.Call):
-                    callee = get_call_name(child.func)
-                    if callee and callee in node_ids:
-                        callee_id = node_ids[callee]
-                        if callee_id != caller_id:
-                            add_link(caller_id, callee_id, "calls")
+def build_python_record(node, lazy=False):
+    record = make_python_record(node, lazy)
+    if record is None or record["kind"] == "Import":
+        return record
+
+    # One breadth-first pass over the definition: nested defs that are direct
+    # children become child records, and every call is credited to the
+    # innermost enclosing function only. Decorator lists are walked with the
+    # scope around the definition, so @retry(3) is a call of that scope.
+    function_records = []
+    if record["kind"] == "Function":
+        function_records.append(record)
+
+    queue = deque([(node, record, record if record["kind"] == "Function" else None, True)])
+    while queue:
+        current, owner, function_record, is_owner_node = queue.popleft()
+        if isinstance(current, list):
+            children = current
+        else:
+            children = ast.iter_child_nodes(current)
+            decorators = getattr(current, "decorator_list", None)
+            if decorators:
+                children = [child for child in children if child not in decorators]
+        for child in children:
+            if is_owner_node and isinstance(child, PYTHON_DEFINITIONS):
+                child_record = make_python_record(child, lazy)
+                owner["children"].append(child_record)
+                if child_record["kind"] == "Function":
+                    function_records.append(child_record)
+                    queue.append((child, child_record, child_record, True))
+                else:
+                    queue.append((child, child_record, function_record, True))
+                if getattr(child, "decorator_list", None):
+                    queue.append((child.decorator_list, owner, function_record, False))
+                continue
+
+            if function_record is not None and isinstance(child, ast.Call):
+                callee = get_call_path(child.func)
+                if callee:
+                    function_record["calls"].append(callee)
+            queue.append((child, owner, function_record, is_owner_node and isinstance(child, PYTHON_BLOCKS)))
+
+    for function_record in function_records:
+        function_record["calls"] = list(dict.fromkeys(function_record["calls"]))
+
+    return record
+
+def assemble_python_diagram(records, root_label="Code Structure", emit=None, metrics=None, output_format="json",
+                            sources=None):
+    metrics = metrics or NO_METRICS
+    graph = DiagramGraph(emit)
+    symbols = SymbolTable()
+    function_records = []
+    decorated_records = []
+
+    def place_record(record, parent_id=None, scope=None):
+        if record["kind"] == "Function":
+            node_type = "Method" if parent_id is not None else "Function"
+            node_id = graph.add_node(record["name"], node_type, record["details"], parent_id)
+            function_records.append((node_id, record["calls"]))
+        else:
+            node_id = graph.add_node(record["name"], record["kind"], record["details"], parent_id)
+        if record.get("decorators"):
+            decorated_records.append((node_id, record["decorators"], scope))
 
-        return {"nodes": nodes, "links": links}
+        if record["kind"] == "Import":
+            symbols.imported.update(record.get("aliases", ()))
+        else:
+            symbols.define(node_id, record["name"], record["kind"], scope, record.get("bases"))
+        if sources is not None and "node" in record:
+            sources[graph.ids[node_id]] = record["node"]
+
+        for child in record["children"]:
+            place_record(child, node_id, node_id)
+
+    with metrics.phase("nodes"):
+        root_id = graph.add_node(root_label, "Root", "Main program structure")
+
+        for kind in ("Import", "Class", "Function"):
+            for record in records:
+                if record["kind"] == kind:
+                    place_record(record, root_id)
+
+    with metrics.phase("calls"):
+        call_count = 0
+        for caller_id, calls in function_records:
+            call_count += len(calls)
+            for call_path in calls:
+                callee_id = symbols.resolve(call_path, caller_id)
+                if callee_id is not None:
+                    graph.add_link(caller_id, callee_id, "calls")
+        for node_id, decorators, scope in decorated_records:
+            for decorator in decorators:
+                decorator_id = symbols.resolve(decorator, scope)
+                if decorator_id is not None and decorator_id != node_id:
+                    graph.add_link(decorator_id, node_id, "decorates")
+    metrics.count("call_sites", call_count)
+
+    return graph.to_output(output_format)
+
+PYTHON_TOP_LEVEL_DEF = re.compile(r'^(?:async\s+def|def|class)\b', re.M)
+PARALLEL_MIN_LINES = 5000
+
+def split_python_module(code, segment_count):
+    # Cuts only go in front of column-0 def/class lines (and the decorators
+    # right above them). A cut that lands inside a string or bracket makes
+    # its segment fail to parse, and the caller falls back to one parse.
+    target = len(code) / segment_count
+    cuts = [0]
+    for match in PYTHON_TOP_LEVEL_DEF.finditer(code):
+        start = match.start()
+        while start > 0:
+            line_start = code.rfind("\n", 0, start - 1) + 1
+            if not code.startswith("@", line_start):
+                break
+            start = line_start
+        if start - cuts[-1] >= target:
+            cuts.append(start)
+    cuts.append(len(code))
+    return [code[begin:end] for begin, end in zip(cuts, cuts[1:])]
+
+def build_python_segment(segment):
+    tree = ast.parse(segment)
+    records = []
+    for node in ast.iter_child_nodes(tree):
+        record = build_python_record(node)
+        if record:
+            records.append(record)
+    return records
+
+def build_python_records_parallel(code, workers):
+    segments = split_python_module(code, workers * 4)
+    if len(segments) < 2:
+        return None
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            segment_records = list(executor.map(build_python_segment, segments))
+    except Exception:
+        # A segment cut in a bad place, a broken pool or a worker error:
+        # the single-process parse below still gets a say.
+        return None
+    return [record for records in segment_records for record in records]
+
+def generate_python_diagram(code, root_label="Code Structure", emit=None, metrics=None, output_format="json",
+                            lazy=False, sources=None, workers=None):
+    metrics = metrics or NO_METRICS
+    try:
+        records = None
+        if workers and workers > 1 and not lazy and code.count("\n") >= PARALLEL_MIN_LINES:
+            with metrics.phase("segments"):
+                records = build_python_records_parallel(code, workers)
+
+        if records is None:
+            with metrics.phase("parse"):
+                tree = ast.parse(code)
+
+            with metrics.phase("records"):
+                records = []
+                for node in ast.iter_child_nodes(tree):
+                    record = build_python_record(node, lazy)
+                    if record:
+                        records.append(record)
+        metrics.count("top_level_records", len(records))
+
+        result = assemble_python_diagram(records, root_label, emit, metrics, output_format, sources)
+        if lazy:
+            result["lazyDetails"] = True
+        return result
 
     except Exception as e:
         return {"error": f"Error parsing Python code: {str(e)}"}
 
-def generate_js_ts_diagram(code, language, root_label=None):
-    nodes = []
-    links = []
-    node_ids = {}
-    link_keys = set()
-    counter = [0]
-    function_bodies = []
-
-    def get_node_id(name):
-        if name not in node_ids:
-            node_ids[name] = f"node{counter[0]}"
-            counter[0] += 1
-        return node_ids[name]
-
-    def add_link(source, target, link_type="contains"):
-        key = (source, target, link_type)
-        if source == target or key in link_keys:
-            return
-        link_keys.add(key)
-        links.append({"source": source, "target": target, "type": link_type})
+def diff_diagrams(previous, current):
+    previous_nodes = {}
+    for node in previous.get("nodes", []):
+        previous_nodes.setdefault(node["id"], node)
+    current_nodes = {}
+    for node in current.get("nodes", []):
+        current_nodes.setdefault(node["id"], node)
+
+    previous_links = {(l["source"], l["target"], l.get("type")): l for l in previous.get("links", [])}
+    current_links = {(l["source"], l["target"], l.get("type")): l for l in current.get("links", [])}
+
+    return {
+        "added": {
+            "nodes": [node for node_id, node in current_nodes.items() if node_id not in previous_nodes],
+            "links": [link for key, link in current_links.items() if key not in previous_links],
+        },
+        "removed": {
+            "nodes": [node_id for node_id in previous_nodes if node_id not in current_nodes],
+            "links": [link for key, link in previous_links.items() if key not in current_links],
+        },
+        "changed": {
+            "nodes": [
+                node for node_id, node in current_nodes.items()
+                if node_id in previous_nodes and previous_nodes[node_id] != node
+            ],
+        },
+    }
 
-    def add_node(name, node_type="", details="", parent=None, body_text=None):
-        node_id = get_node_id(name)
+class PythonDiagramSession:
+    def __init__(self, code, root_label="Code Structure"):
+        self.root_label = root_label
+        self.lines = []
+        self.segments = []
+        self.result = {"nodes": [], "links": []}
+        self.rebuild(code)
+
+    def rebuild(self, code):
+        lines = code.split("\n")
+        try:
+            segments = self.parse_region(lines, 1, len(lines))
+        except SyntaxError:
+            self.lines = []
+            self.segments = []
+            self.result = generate_python_diagram(code, self.root_label)
+            return self.result
+
+        self.lines = lines
+        self.segments = segments
+        self.result = self.assemble()
+        return self.result
+
+    def parse_region(self, lines, start, end):
+        tree = ast.parse("\n".join(lines[start - 1:end]))
+        ast.increment_lineno(tree, start - 1)
+
+        segments = []
+        last_line = start - 1
+        for node in tree.body:
+            first_line = node.lineno
+            for decorator in getattr(node, "decorator_list", []):
+                first_line = min(first_line, decorator.lineno)
+
+            record = build_python_record(node)
+            if segments and first_line <= last_line:
+                if record:
+                    segments[-1]["records"].append(record)
+            else:
+                segments.append({"start": first_line, "end": end, "records": [record] if record else []})
+            last_line = max(last_line, getattr(node, "end_lineno", None) or node.lineno)
+
+        if not segments:
+            return [{"start": start, "end": end, "records": []}]
+
+        segments[0]["start"] = start
+        for previous, following in zip(segments, segments[1:]):
+            previous["end"] = following["start"] - 1
+        return segments
+
+    def assemble(self):
+        records = [record for segment in self.segments for record in segment["records"]]
+        return assemble_python_diagram(records, self.root_label)
+
+    def update(self, code, edits):
+        previous = self.result
+        if not edits or not self.segments:
+            return diff_diagrams(previous, self.rebuild(code))
+
+        lines = code.split("\n")
+        edits = sorted(
+            (int(edit["start"]), int(edit["end"]), int(edit["lines"]))
+            for edit in edits
+        )
+
+        segments = []
+        dirty_start = None
+        shift = 0
+        edit_index = 0
+        try:
+            for segment in self.segments:
+                while edit_index < len(edits) and edits[edit_index][1] < segment["start"] - 1:
+                    edit_start, edit_end, line_count = edits[edit_index]
+                    shift += line_count - (edit_end - edit_start + 1)
+                    edit_index += 1
+
+                dirty = any(
+                    edit_start <= segment["end"] + 1 and edit_end >= segment["start"] - 1
+                    for edit_start, edit_end, _ in edits[edit_index:]
+                )
+                if dirty:
+                    if dirty_start is None:
+                        dirty_start = segments[-1]["end"] + 1 if segments else 1
+                    continue
+
+                new_start = segment["start"] + shift
+                if lines[new_start - 1:new_start] != self.lines[segment["start"] - 1:segment["start"]]:
+                    return diff_diagrams(previous, self.rebuild(code))
+
+                if dirty_start is not None:
+                    if new_start - 1 >= dirty_start:
+                        segments.extend(self.parse_region(lines, dirty_start, new_start - 1))
+                    dirty_start = None
+                segments.append({
+                    "start": new_start,
+                    "end": segment["end"] + shift,
+                    "records": segment["records"],
+                })
+
+            if dirty_start is not None:
+                segments.extend(self.parse_region(lines, dirty_start, len(lines)))
+            elif segments[-1]["end"] != len(lines):
+                return diff_diagrams(previous, self.rebuild(code))
+        except SyntaxError:
+            return diff_diagrams(previous, self.rebuild(code))
+
+        self.lines = lines
+        self.segments = segments
+        self.result = self.assemble()
+        return diff_diagrams(previous, self.result)
+
+# A leading "." marks a call on some other receiver (items.push(...)).
+JS_CALL_PATTERN = re.compile(r'(\.\s*)?(?<![\w$])((?:this\.)?[A-Za-z_$][\w$]*)\s*\(')
+JS_TOKEN_START = r'(?=[/"\'`]|(?<![\w$])[A-Za-z_])'
+JS_DECLARATIONS = (
+    r'(?P<skip>//[^\n]*|/\*[\s\S]*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\[\s\S]|[^`\\])*`)'
+    r'|(?P<class>(?:export\s+)?class\s+(?P<class_name>\w+)(?:\s+extends\s+(?P<class_extends>\w+))?(?:\s+implements\s+(?P<class_implements>[^{]+))?\s*(?P<class_open>\{)\s*(?:\/\*\*(?P<class_doc>[^*]*)\*\/)?\s*)'
+    r'|(?P<function>(?:export\s+)?(?:async\s+)?(?:function|const)\s+(?P<function_name>\w+)\s*[=]?\s*\((?P<function_params>[^)]*)\)(?:\s*:\s*(?P<function_returns>[^{=]+))?\s*(?:=>|\{)\s*(?:\/\*\*(?P<function_doc>[^*]*)\*\/)?\s*)'
+)
+# Inside a class body "name(" may also start a method, so that scanner adds
+# one more alternative; elsewhere it would only match call sites.
+JS_SCANNER = re.compile(f"{JS_TOKEN_START}(?:{JS_DECLARATIONS})")
+JS_CLASS_SCANNER = re.compile(f"{JS_TOKEN_START}(?:{JS_DECLARATIONS}|(?P<method>(?:async\\s+)?(?P<method_name>\\w+)\\s*\\())")
+JS_METHOD_SIGNATURE = re.compile(r'([^)]*)\)(?:\s*:\s*([^{=;]+))?')
+JS_BODY_DOC = re.compile(r'\{\s*\/\*\*([^*]*)\*\/')
+
+def generate_js_ts_diagram(code, language, root_label=None, emit=None, metrics=None, output_format="json"):
+    metrics = metrics or NO_METRICS
+    graph = DiagramGraph(emit)
+    symbols = SymbolTable()
+    function_bodies = []
 
+    def add_node(name, node_type="", details="", parent=None, body_text=None, scope=None):
         if body_text and node_type in ("Function", "Method") and is_react_component(body_text):
             node_type = "Component"
 
-        colors = get_colors(node_type)
-
-        nodes.append({
-            "id": node_id,
-            "name": name,
-            "type": node_type,
-            "color": colors["fill"],
-            "textColor": colors["text"],
-            "details": details
-        })
-
-        if parent:
-            add_link(parent, node_id, "contains")
+        node_id = graph.add_node(name, node_type, details, parent)
+        if node_type != "Root":
+            symbols.define(node_id, name, node_type, scope)
 
-        if body_text and node_type in ("Function", "Method", "Component"):
-            function_bodies.append((name, node_id, body_text))
+        if node_type in ("Function", "Method", "Component") and body_text:
+            function_bodies.append((node_id, body_text))
 
         return node_id
 
     label = root_label or f"{language} Structure"
     root_id = add_node(label, "Root", "Main program structure")
-
-    class_pattern = r'(?:export\s+)?class\s+(\w+)(?:\s+extends\s+(\w+))?(?:\s+implements\s+([^{]+))?\s*{\s*(?:\/\*\*([^*]*)\*\/)?\s*'
-    function_pattern = r'(?:export\s+)?(?:async\s+)?(?:function|const)\s+(\w+)\s*[=]?\s*(?:\(([^)]*)\))(?:\s*:\s*([^{=]+))?\s*(?:=>|{)\s*(?:\/\*\*([^*]*)\*\/)?\s*'
-
-    for match in re.finditer(class_pattern, code):
-        name = match.group(1)
-        extends = match.group(2)
-        implements = match.group(3)
-        doc = match.group(4)
-
-        details = []
-        if extends:
-            details.append(f"Extends: {extends}")
-        if implements:
-            details.append(f"Implements: {implements}")
-        if doc:
-            details.append(f"Description: {doc.strip()}")
-
-        class_id = add_node(name, "Class", "\\n".join(details), root_id)
-
-        class_body_text = extract_braced_body(code, match.end())
-        method_pattern = r'(?:async\s+)?(\w+)\s*\(([^)]*)\)(?:\s*:\s*([^{=]+))?\s*{?\s*(?:\/\*\*([^*]*)\*\/)?\s*'
-
-        for method_match in re.finditer(method_pattern, class_body_text):
-            method_name = method_match.group(1)
-            params = method_match.group(2)
-            return_type = method_match.group(3)
-            method_doc = method_match.group(4)
-
-            method_details = []
-            if params:
-                method_details.append(f"Parameters: ({params})")
-            if return_type:
-                method_details.append(f"Returns: {return_type}")
-            if method_doc:
-                method_details.append(f"Description: {method_doc.strip()}")
-
-            method_body = extract_braced_body(class_body_text, method_match.end())
-            add_node(method_name, "Method", "\\n".join(method_details), class_id, method_body)
-
-    for match in re.finditer(function_pattern, code):
-        name = match.group(1)
-        params = match.group(2)
-        return_type = match.group(3)
-        doc = match.group(4)
-
-        if name and not name.startswith('_'):
-            details = []
-            if params:
-                details.append(f"Parameters: ({params})")
-            if return_type:
-                details.append(f"Returns: {return_type}")
-            if doc:
-                details.append(f"Description: {doc.strip()}")
-
-            body_start = match.end()
-            body_text = extract_braced_body(code, body_start)
-            add_node(name, "Function", "\\n".join(details), root_id, body_text)
-
-    known_names = {n["name"] for n in nodes if n["type"] in ("Function", "Method", "Component")}
-    for name, caller_id, body in function_bodies:
-        for other in known_names:
-            if other != name and f"{other}(" in body:
-                if other in node_ids:
-                    add_link(caller_id, node_ids[other], "calls")
-
-    return {"nodes": nodes, "links": links}
-
-def generate_cpp_diagram(code, root_label="C++ Structure"):
-    nodes = []
-    links = []
-    node_ids = {}
-    counter = [0]
-
-    def get_node_id(name):
-        if name not in node_ids:
-            node_ids[name] = f"node{counter[0]}"
-            counter[0] += 1
-        return node_ids[name]
-
-    def add_node(name, node_type="", details="", parent=None):
-        node_id = get_node_id(name)
-        colors = get_colors(node_type)
-
-        nodes.append({
-            "id": node_id,
-            "name": name,
-            "type": node_type,
-            "color": colors["fill"],
-            "textColor": colors["text"],
-            "details": details
-        })
-
-        if parent:
-            links.append({"source": parent, "target": node_id, "type": "contains"})
-
-        return node_id
+    with metrics.phase("braces"):
+        braces = BraceIndex(code)
+
+    # A single scan collects classes, their methods and functions. Each class
+    # keeps the spans of the braces directly inside its body, so a "name("
+    # token only starts a method when it falls between those spans. Nodes
+    # are placed afterwards, classes first, so ids follow the declaration
+    # kinds rather than scan order.
+    classes = []
+    functions = []
+    scopes = []
+    pos = 0
+
+    with metrics.phase("scan"):
+        while True:
+            match = (JS_CLASS_SCANNER if scopes else JS_SCANNER).search(code, pos)
+            if not match:
+                break
+            metrics.count("regex_matches")
+            pos = match.end()
+            kind = match.lastgroup
+            if kind == "skip":
+                continue
+
+            while scopes and match.start() > scopes[-1][3]:
+                scopes.pop()
+
+            if kind == "class":
+                details = []
+                if match.group("class_extends"):
+                    details.append(f"Extends: {match.group('class_extends')}")
+                if match.group("class_implements"):
+                    details.append(f"Implements: {match.group('class_implements')}")
+                if match.group("class_doc"):
+                    details.append(f"Description: {match.group('class_doc').strip()}")
+
+                methods = []
+                classes.append((match.group("class_name"), "\\n".join(details), methods))
+                class_open = match.start("class_open")
+                class_close = braces.close(class_open)
+                member_opens = []
+                member_closes = []
+                member_open = braces.find_open(class_open + 1, class_close)
+                while member_open is not None:
+                    member_opens.append(member_open)
+                    member_closes.append(braces.close(member_open))
+                    member_open = braces.find_open(member_closes[-1] + 1, class_close)
+                scopes.append((methods, member_opens, member_closes, class_close))
+
+            elif kind == "function":
+                name = match.group("function_name")
+                params = match.group("function_params")
+                return_type = match.group("function_returns")
+                doc = match.group("function_doc")
+
+                if name and not name.startswith('_'):
+                    details = []
+                    if params:
+                        details.append(f"Parameters: ({params})")
+                    if return_type:
+                        details.append(f"Returns: {return_type}")
+                    if doc:
+                        details.append(f"Description: {doc.strip()}")
+
+                    signature_end = match.end("function_returns") if return_type else match.end("function_params") + 1
+                    body_text = extract_braced_body(code, signature_end, braces)
+                    functions.append((name, "\\n".join(details), body_text))
+
+            elif kind == "method":
+                if not scopes:
+                    continue
+                methods, member_opens, member_closes, _ = scopes[-1]
+                index = bisect.bisect_right(member_opens, match.start()) - 1
+                if index >= 0 and match.start() < member_closes[index]:
+                    continue
+                signature = JS_METHOD_SIGNATURE.match(code, pos)
+                if not signature:
+                    continue
+
+                params, return_type = signature.groups()
+                signature_end = signature.end(2) if return_type else signature.end(1) + 1
+                pos = signature.end()
+                body_span = find_body_span(code, signature_end, braces)
+
+                method_details = []
+                if params:
+                    method_details.append(f"Parameters: ({params})")
+                if return_type:
+                    method_details.append(f"Returns: {return_type}")
+                doc_match = JS_BODY_DOC.match(code, body_span[0]) if body_span else None
+                if doc_match:
+                    method_details.append(f"Description: {doc_match.group(1).strip()}")
+
+                method_body = code[body_span[0]:body_span[1]] if body_span else ''
+                methods.append((match.group("method_name"), "\\n".join(method_details), method_body))
+
+    with metrics.phase("nodes"):
+        for name, details, methods in classes:
+            class_id = add_node(name, "Class", details, root_id)
+            for method_name, method_details, method_body in methods:
+                add_node(method_name, "Method", method_details, class_id, method_body, class_id)
+
+        for name, details, body_text in functions:
+            add_node(name, "Function", details, root_id, body_text)
+
+    with metrics.phase("calls"):
+        for caller_id, body in function_bodies:
+            called = [
+                f"{UNKNOWN_RECEIVER}.{name}" if receiver else name
+                for receiver, name in JS_CALL_PATTERN.findall(body)
+            ]
+            metrics.count("regex_matches", len(called))
+            for call_path in dict.fromkeys(called):
+                callee_id = symbols.resolve(call_path, caller_id)
+                if callee_id is not None and symbols.kinds[callee_id] != "Class":
+                    graph.add_link(caller_id, callee_id, "calls")
+
+    return graph.to_output(output_format)
+
+CPP_SCANNER = re.compile(
+    r'(?P<skip>//[^\n]*|/\*[\s\S]*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\')'
+    r'|(?P<class>\bclass\s+(?P<class_name>\w+)(?:\s*:\s*(?:public|private|protected)\s+(?P<class_bases>[^{;]+))?\s*(?P<class_open>\{)\s*(?:\/\*\*(?P<class_doc>[^*]*)\*\/)?\s*)'
+    r'|(?P<function>(?:virtual\s+)?(?:static\s+)?(?P<return_type>\w+)\s+(?P<function_name>\w+)\s*\((?P<params>[^)]*)\)\s*(?:const|noexcept|override|final|)?\s*(?P<terminator>\{|;)\s*(?:\/\*\*(?P<function_doc>[^*]*)\*\/)?\s*)'
+    r'|(?P<open>\{)|(?P<close>\})|(?P<end>;)'
+)
+CPP_BLOCK_PREFIX = re.compile(r'\b(?:namespace|extern|struct|union)\b')
+
+def generate_cpp_diagram(code, root_label="C++ Structure", emit=None, metrics=None, output_format="json"):
+    metrics = metrics or NO_METRICS
+    graph = DiagramGraph(emit, dedupe_links=False)
+    add_node = graph.add_node
 
     root_id = add_node(root_label, "Root", "Main program structure")
 
-    class_pattern = r'class\s+(\w+)(?:\s*:\s*(?:public|private|protected)\s+([^{]+))?\s*{\s*(?:\/\*\*([^*]*)\*\/)?\s*'
-    function_pattern = r'(?:virtual\s+)?(?:static\s+)?(\w+)\s+(\w+)\s*\(([^)]*)\)\s*(?:const|noexcept|override|final|)?\s*(?:{|;)\s*(?:\/\*\*([^*]*)\*\/)?\s*'
-
-    for match in re.finditer(class_pattern, code):
-        name = match.group(1)
-        inheritance = match.group(2)
-        doc = match.group(3)
-
-        details = []
-        if inheritance:
-            details.append(f"Inherits: {inheritance}")
-        if doc:
-            details.append(f"Description: {doc.strip()}")
-
-        class_id = add_node(name, "Class", "\\n".join(details), root_id)
-
-        class_body = code[match.end():].split("\n")
-        for line in class_body:
-            method_match = re.search(function_pattern, line)
-            if method_match:
-                return_type = method_match.group(1)
-                method_name = method_match.group(2)
-                params = method_match.group(3)
-                method_doc = method_match.group(4)
-
-                if method_name and method_name not in ['if', 'for', 'while', 'switch']:
-                    method_details = [f"Return Type: {return_type}"]
-                    if params:
-                        method_details.append(f"Parameters: ({params})")
-                    if method_doc:
-                        method_details.append(f"Description: {method_doc.strip()}")
+    # Function and other statement bodies are skipped whole through the brace
+    # index; only class bodies and namespace-like blocks are entered, and
+    # they are tracked as (kind, node_id, close_pos) scopes.
+    with metrics.phase("braces"):
+        braces = BraceIndex(code)
+    scopes = []
+    statement_start = 0
+    pos = 0
+
+    with metrics.phase("scan"):
+        while True:
+            match = CPP_SCANNER.search(code, pos)
+            if not match:
+                break
+            metrics.count("regex_matches")
+            pos = match.end()
+            kind = match.lastgroup
+            if kind == "skip":
+                continue
+
+            while scopes and match.start() > scopes[-1][2]:
+                scopes.pop()
+            owner = next((scope for scope in reversed(scopes) if scope[0] == "class"), None)
+
+            if kind == "class":
+                details = []
+                if match.group("class_bases"):
+                    details.append(f"Inherits: {match.group('class_bases')}")
+                if match.group("class_doc"):
+                    details.append(f"Description: {match.group('class_doc').strip()}")
+
+                parent_id = owner[1] if owner else root_id
+                class_id = add_node(match.group("class_name"), "Class", "\\n".join(details), parent_id)
+                scopes.append(("class", class_id, braces.close(match.start("class_open"))))
+
+            elif kind == "function":
+                name = match.group("function_name")
+                if name not in ['if', 'for', 'while', 'switch']:
+                    details = [f"Return Type: {match.group('return_type')}"]
+                    if match.group("params"):
+                        details.append(f"Parameters: ({match.group('params')})")
+                    if match.group("function_doc"):
+                        details.append(f"Description: {match.group('function_doc').strip()}")
+
+                    if owner:
+                        add_node(name, "Method", "\\n".join(details), owner[1])
+                    else:
+                        add_node(name, "Function", "\\n".join(details), root_id)
+
+                if match.group("terminator") == "{":
+                    pos = max(pos, braces.close(match.start("terminator")) + 1)
+
+            elif kind == "open":
+                prefix = code[statement_start:match.start()]
+                if owner is None and CPP_BLOCK_PREFIX.search(prefix):
+                    scopes.append(("block", None, braces.close(match.start())))
+                else:
+                    pos = braces.close(match.start()) + 1
 
-                    add_node(method_name, "Method", "\\n".join(method_details), class_id)
+            statement_start = pos
 
-    for match in re.finditer(function_pattern, code):
-        return_type = match.group(1)
-        name = match.group(2)
-        params = match.group(3)
-        doc = match.group(4)
+    return graph.to_output(output_format)
 
-        if name and name not in ['if', 'for', 'while', 'switch']:
-            details = [f"Return Type: {return_type}"]
-            if params:
-                details.append(f"Parameters: ({params})")
-            if doc:
-                details.append(f"Description: {doc.strip()}")
+def handle_update(request, sessions, max_sessions=16):
+    code = request.get("code")
+    filename = request.get("filename")
+    root_label = os.path.basename(filename) if filename else "Code Structure"
+    key = filename or root_label
 
-            add_node(name, "Function", "\\n".join(details), root_id)
+    if not code:
+        return {"error": "No code provided"}
 
-    return {"nodes": nodes, "links": links}
+    session = sessions.get(key)
+    if session is None:
+        session = PythonDiagramSession(code, root_label)
+        sessions[key] = session
+        while len(sessions) > max_sessions:
+            sessions.popitem(last=False)
+        return session.result
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print(json.dumps({"error": "No language provided"}))
-        sys.exit(1)
+    sessions.move_to_end(key)
+    try:
+        diff = session.update(code, request.get("edits") or [])
+    except (KeyError, TypeError, ValueError):
+        return {"error": "Invalid edit ranges"}
+    if "error" in session.result:
+        return session.result
+    return {"diff": diff}
+
+def describe_nodes(code, language, node_ids, filename=None, cache=None, detail_sources=None, max_sources=16):
+    root_label = filename or "Code Structure"
+    wanted = set(node_ids)
+
+    if language != "python":
+        result = parse_code(code, language, filename, cache)
+        if "error" in result:
+            return result
+        return {"details": {node["id"]: node["details"] for node in result["nodes"] if node["id"] in wanted}}
 
-    language = sys.argv[1]
-    filename = sys.argv[2] if len(sys.argv) > 2 else None
+    key = hashlib.sha256(code.encode("utf-8", "surrogatepass")).hexdigest()
+    sources = detail_sources.get(key) if detail_sources is not None else None
+    if sources is None:
+        sources = {}
+        result = generate_python_diagram(code, root_label, lazy=True, sources=sources)
+        if "error" in result:
+            return result
+        if detail_sources is not None:
+            detail_sources[key] = sources
+            while len(detail_sources) > max_sources:
+                detail_sources.popitem(last=False)
+    else:
+        detail_sources.move_to_end(key)
+
+    return {"details": {node_id: python_details(sources[node_id]) for node_id in node_ids if node_id in sources}}
+
+OUTPUT_FORMATS = ("json", "columnar", "mermaid")
+
+def request_options(request):
+    # Checks the optional fields up front so a bad value is answered with an
+    # error instead of failing somewhere inside the parser.
+    options = {}
+    for field, minimum in (("maxNodes", 1), ("maxDepth", 0), ("top", 1), ("workers", 1)):
+        value = request.get(field)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < minimum):
+            raise ValueError(f"{field} must be an integer of at least {minimum}")
+        options[field] = value
+    for field, choices, default in (("format", OUTPUT_FORMATS, "json"), ("validate", VALIDATION_MODES, "auto")):
+        value = request.get(field) or default
+        if value not in choices:
+            raise ValueError(f"{field} must be one of {', '.join(choices)}")
+        options[field] = value
+    for field in ("expand", "entries", "nodes"):
+        value = request.get(field)
+        if value is not None and (not isinstance(value, list) or not all(isinstance(item, str) for item in value)):
+            raise ValueError(f"{field} must be a list of strings")
+        options[field] = value
+    return options
+
+def handle_request(request, cache=None, sessions=None, stdout=None, detail_sources=None, compact=False):
+    if not isinstance(request, dict):
+        return {"id": None, "result": {"error": "Invalid request"}}
+
+    request_id = request.get("id")
+    command = request.get("command")
+    if command == "stats":
+        stats = cache.stats() if cache else {"hits": 0, "misses": 0, "entries": 0}
+        return {"id": request_id, "result": stats}
+    if command == "update":
+        if sessions is None:
+            sessions = OrderedDict()
+        return {"id": request_id, "result": handle_update(request, sessions)}
+
+    code = request.get("code")
+    language = request.get("language")
+    filename = request.get("filename")
     if filename:
         filename = os.path.basename(filename)
 
+    if not language:
+        return {"id": request_id, "result": {"error": "No language provided"}}
+    if not code:
+        return {"id": request_id, "result": {"error": "No code provided"}}
+    try:
+        options = request_options(request)
+    except ValueError as e:
+        return {"id": request_id, "result": {"error": f"Invalid request: {str(e)}"}}
+
+    if request.get("stream") and stdout is not None:
+        encode = json_encoder(compact)
+
+        def emit(kind, record):
+            stdout.write(encode({"id": request_id, kind: record}) + b"\n")
+
+        return {"id": request_id, "result": stream_diagram(code, language, filename or "Code Structure", emit)}
+
+    if command == "details":
+        node_ids = options["nodes"]
+        if node_ids is None:
+            return {"id": request_id, "result": {"error": "No node ids provided"}}
+        return {"id": request_id, "result": describe_nodes(code, language, node_ids, filename, cache, detail_sources)}
+    if command == "analyze":
+        output_format = options["format"] if options["format"] != "mermaid" else "json"
+        result = parse_code(code, language, filename, cache, output_format=output_format)
+        return {"id": request_id, "result": analyze_calls(result, options["entries"], options["top"] or 10)}
+
+    result = parse_code(
+        code, language, filename, cache,
+        profile=request.get("profile", False),
+        output_format=options["format"],
+        lazy=request.get("lazyDetails", False),
+        max_nodes=options["maxNodes"],
+        max_depth=options["maxDepth"],
+        expand=options["expand"],
+        layout=request.get("layout", False),
+        workers=options["workers"],
+        validation=options["validate"],
+    )
+    return {"id": request_id, "result": result}
+
+def serve(stdin=None, stdout=None, cache=None, compact=False):
+    # Responses are written as bytes: with orjson, compact output carries
+    # raw UTF-8, which a text stream would re-encode.
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout.buffer
+    encode = json_encoder(compact)
+    cache = cache or ResultCache()
+    sessions = OrderedDict()
+    detail_sources = OrderedDict()
+
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response = {"id": None, "result": {"error": f"Invalid request: {str(e)}"}}
+        else:
+            # One bad request must not take the daemon, and every request
+            # still waiting on it, down with it.
+            try:
+                response = handle_request(request, cache, sessions, stdout, detail_sources, compact)
+            except Exception as e:
+                request_id = request.get("id") if isinstance(request, dict) else None
+                response = {"id": request_id, "result": {"error": f"Error handling request: {str(e)}"}}
+        stdout.write(encode(response) + b"\n")
+        stdout.flush()
+
+LANGUAGE_EXTENSIONS = {
+    ".py": "python",
+    ".js": "javascript",
+    ".mjs": "javascript",
+    ".cjs": "javascript",
+    ".jsx": "javascriptreact",
+    ".ts": "typescript",
+    ".tsx": "typescriptreact",
+    ".cpp": "cpp",
+    ".cc": "cpp",
+    ".cxx": "cpp",
+    ".hpp": "cpp",
+    ".hh": "cpp",
+    ".h": "cpp",
+    ".c": "c",
+}
+SKIPPED_DIRECTORIES = {".git", "node_modules", "__pycache__", ".venv", "venv", ".tox"}
+
+def detect_language(path):
+    return LANGUAGE_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+def collect_files(paths, pattern=None):
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+
+        found = []
+        for directory, subdirectories, filenames in os.walk(path):
+            subdirectories[:] = sorted(d for d in subdirectories if d not in SKIPPED_DIRECTORIES)
+            for filename in filenames:
+                file_path = os.path.join(directory, filename)
+                relative_path = os.path.relpath(file_path, path).replace(os.sep, "/")
+                if pattern:
+                    if not fnmatch.fnmatch(relative_path, pattern):
+                        continue
+                elif not detect_language(filename):
+                    continue
+                found.append(file_path)
+        files.extend(sorted(found))
+    return files
+
+def parse_file(path, cache_dir=None, output_format="json"):
+    language = detect_language(path)
+    entry = {"path": path, "language": language}
+
+    if not language:
+        entry["result"] = {"error": "Unsupported file type"}
+        return entry
+
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            code = f.read()
+    except OSError as e:
+        entry["result"] = {"error": f"Error reading file: {str(e)}"}
+        return entry
+
+    if not code:
+        entry["result"] = {"error": "No code provided"}
+        return entry
+
+    cache = ResultCache(cache_dir=cache_dir) if cache_dir else None
+    entry["result"] = parse_code(code, language, os.path.basename(path), cache, output_format=output_format)
+    return entry
+
+def parse_files(paths, workers=None, cache_dir=None, output_format="json"):
+    worker = functools.partial(parse_file, cache_dir=cache_dir, output_format=output_format)
+
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(paths) < 2:
+        files = [worker(path) for path in paths]
+    else:
+        chunksize = max(1, len(paths) // (workers * 4))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            files = list(executor.map(worker, paths, chunksize=chunksize))
+
+    failed = sum(1 for entry in files if "error" in entry["result"])
+    return {"files": files, "summary": {"files": len(files), "failed": failed}}
+
+def collect_python_imports(statements, imports, scopes=None, path=()):
+    # Imports inside a def or class body are kept apart in scopes, keyed by
+    # the path of names leading to that definition.
+    for node in statements:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname:
+                    imports.append((alias.asname, 0, alias.name, None))
+                else:
+                    imports.append((alias.name.split(".")[0], 0, alias.name.split(".")[0], None))
+                    imports.append((None, 0, alias.name, None))
+        elif isinstance(node, ast.ImportFrom):
+            for alias in node.names:
+                if alias.name != "*":
+                    imports.append((alias.asname or alias.name, node.level, node.module, alias.name))
+        elif isinstance(node, PYTHON_DEFINITIONS):
+            if scopes is not None:
+                scope_path = path + (node.name,)
+                local = collect_python_imports(node.body, [], scopes, scope_path)
+                if local:
+                    scopes[scope_path] = local
+        else:
+            for field in ("body", "orelse", "finalbody", "handlers"):
+                collect_python_imports(getattr(node, field, None) or [], imports, scopes, path)
+    return imports
+
+def index_python_module(path):
+    entry = {"path": path, "records": [], "imports": [], "scopes": {}}
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            tree = ast.parse(f.read())
+    except (OSError, SyntaxError, ValueError) as e:
+        entry["error"] = str(e)
+        return entry
+
+    for node in tree.body:
+        record = build_python_record(node)
+        if record and record["kind"] != "Import":
+            entry["records"].append(record)
+    collect_python_imports(tree.body, entry["imports"], entry["scopes"])
+    return entry
+
+def python_module_name(path, package_dirs):
+    directory, filename = os.path.split(os.path.abspath(path))
+    is_package = filename == "__init__.py"
+    parts = [] if is_package else [os.path.splitext(filename)[0]]
+
+    while True:
+        if directory not in package_dirs:
+            package_dirs[directory] = os.path.isfile(os.path.join(directory, "__init__.py"))
+        if not package_dirs[directory]:
+            break
+        parts.insert(0, os.path.basename(directory))
+        directory = os.path.dirname(directory)
+
+    return ".".join(parts), is_package
+
+def resolve_import_base(module, is_package, level, target):
+    if not level:
+        return target or ""
+    base = module.split(".") if is_package else module.split(".")[:-1]
+    if level > 1:
+        base = base[:max(0, len(base) - (level - 1))]
+    if target:
+        base.append(target)
+    return ".".join(base)
+
+def generate_python_project_diagram(root, root_label=None, workers=None, output_format="json"):
+    paths = collect_files([root], "*.py")
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(paths) < 2:
+        entries = [index_python_module(path) for path in paths]
+    else:
+        chunksize = max(1, len(paths) // (workers * 4))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            entries = list(executor.map(index_python_module, paths, chunksize=chunksize))
+
+    graph = DiagramGraph()
+    add_node = graph.add_node
+
+    root_id = add_node(root_label or os.path.basename(os.path.abspath(root)), "Root", "Project structure")
+
+    # Symbol index, built once: module -> top-level names, class methods,
+    # every defined name (None once it is defined twice; for the same-module
+    # fallback) and import aliases.
+    package_dirs = {}
+    modules = {}
+    function_records = []
+    decorated_records = []
+
+    def place_record(record, module, parent_id, class_name, table, path=()):
+        enclosing = path
+        path = path + (record["name"],)
+        if record["kind"] == "Function":
+            node_type = "Method" if class_name else "Function"
+            node_id = add_node(record["name"], node_type, record["details"], parent_id)
+            function_records.append((module, class_name, node_id, record["calls"], path))
+            if class_name:
+                table["classes"][class_name].setdefault(record["name"], node_id)
+        else:
+            node_id = add_node(record["name"], record["kind"], record["details"], parent_id)
+            table["classes"].setdefault(record["name"], {})
+        if record.get("decorators"):
+            decorated_records.append((module, node_id, record["decorators"], enclosing))
+
+        defined = table["names"]
+        defined[record["name"]] = None if record["name"] in defined else node_id
+        for child in record["children"]:
+            place_record(child, module, node_id, record["name"] if record["kind"] == "Class" else None, table, path)
+        return node_id
+
+    # Files outside packages can share a module name (tests/unit/conftest.py
+    # and tests/integration/conftest.py are both "conftest"). Each of those
+    # is named by its relative path instead, which no import resolves to.
+    names = [python_module_name(entry["path"], package_dirs) for entry in entries]
+    name_counts = {}
+    for module, _ in names:
+        name_counts[module] = name_counts.get(module, 0) + 1
+
+    for entry, (module, is_package) in zip(entries, names):
+        if name_counts.get(module, 0) > 1:
+            module = os.path.splitext(os.path.relpath(entry["path"], root))[0].replace(os.sep, "/")
+        if not module or module in modules:
+            continue
+
+        details = f"Path: {os.path.relpath(entry['path'], root)}"
+        if "error" in entry:
+            details += f"\\nError: {entry['error']}"
+        module_id = add_node(module, "Module", details, root_id)
+
+        table = {
+            "id": module_id, "is_package": is_package, "top": {}, "classes": {}, "names": {}, "imports": {}, "scopes": {},
+        }
+        modules[module] = table
+        for record in entry["records"]:
+            node_id = place_record(record, module, module_id, None, table)
+            table["top"].setdefault(record["name"], node_id)
+
+        table["raw_imports"] = entry["imports"]
+        table["raw_scopes"] = entry["scopes"]
+
+    prefixes = set()
+    for module in modules:
+        parts = module.split(".")
+        for i in range(1, len(parts) + 1):
+            prefixes.add(".".join(parts[:i]))
+
+    def find_module(name):
+        while name and name not in modules:
+            name = name.rpartition(".")[0]
+        return name or None
+
+    for module, table in modules.items():
+        scoped = [(None, table.pop("raw_imports"))] + list(table.pop("raw_scopes").items())
+        for path, imports in scoped:
+            aliases = table["imports"] if path is None else table["scopes"].setdefault(path, {})
+            for alias, level, target, symbol in imports:
+                base = resolve_import_base(module, table["is_package"], level, target)
+                if alias:
+                    aliases[alias] = (base, symbol)
+                imported = f"{base}.{symbol}" if symbol and f"{base}.{symbol}" in modules else base
+                imported_module = find_module(imported)
+                if imported_module and imported_module != module:
+                    graph.add_link(table["id"], modules[imported_module]["id"], "imports")
+
+    def local_import(table, path, name):
+        # Function-local imports, innermost scope first; nested functions
+        # see the imports of the functions around them.
+        while path:
+            aliases = table["scopes"].get(path)
+            if aliases and name in aliases:
+                return aliases[name]
+            path = path[:-1]
+        return None
+
+    def resolve(module, parts, depth=0):
+        while len(parts) > 1 and f"{module}.{parts[0]}" in prefixes:
+            module = f"{module}.{parts[0]}"
+            parts = parts[1:]
+        if len(parts) == 1 and f"{module}.{parts[0]}" in prefixes:
+            return None
+
+        table = modules.get(module)
+        if table is None or depth > 8:
+            return None
+
+        head = parts[0]
+        if head in table["top"]:
+            if len(parts) == 1:
+                return table["top"][head]
+            if len(parts) == 2:
+                return table["classes"].get(head, {}).get(parts[1])
+            return None
+        if head in table["imports"]:
+            target, symbol = table["imports"][head]
+            return resolve(target, ([symbol] if symbol else []) + parts[1:], depth + 1)
+        return None
+
+    def resolve_call(module, class_name, path, call_path):
+        # path is the function the call is made in, or () at module level.
+        table = modules[module]
+        parts = call_path.split(".")
+        callee_id = None
+        local = local_import(table, path, parts[0]) if table["scopes"] else None
+        if local is not None:
+            target, symbol = local
+            callee_id = resolve(target, ([symbol] if symbol else []) + parts[1:], 1)
+        elif parts[0] in ("self", "cls") and class_name and len(parts) == 2:
+            callee_id = table["classes"][class_name].get(parts[1])
+        elif parts[0] in table["top"] or parts[0] in table["imports"]:
+            callee_id = resolve(module, parts)
+        if callee_id is None and local is None and parts[0] not in table["imports"]:
+            if len(parts) == 1 or parts[0] == UNKNOWN_RECEIVER:
+                callee_id = table["names"].get(parts[-1])
+        return callee_id
+
+    for module, class_name, caller_id, calls, path in function_records:
+        for call_path in calls:
+            callee_id = resolve_call(module, class_name, path, call_path)
+            if callee_id is not None:
+                graph.add_link(caller_id, callee_id, "calls")
+
+    for module, node_id, decorators, path in decorated_records:
+        for decorator in decorators:
+            decorator_id = resolve_call(module, None, path, decorator)
+            if decorator_id is not None and decorator_id != node_id:
+                graph.add_link(decorator_id, node_id, "decorates")
+
+    return graph.to_output(output_format)
+
+CALLABLE_TYPES = frozenset(["Function", "Method", "Component"])
+IMPLICIT_ENTRY_NAMES = frozenset(["constructor", "main"])
+CONSTRUCTOR_NAMES = frozenset(["__init__", "__new__", "__post_init__", "constructor"])
+
+class CallGraph:
+    # The "calls" links of a diagram in compressed adjacency form: the
+    # callees of node i are targets[offsets[i]:offsets[i + 1]], and callers
+    # use the same layout. Every query below is linear in nodes + calls.
+    __slots__ = (
+        "ids", "names", "types", "index", "offsets", "targets", "reverse_offsets", "sources", "constructors",
+        "decorators",
+    )
+
+    def __init__(self, result):
+        if result.get("format") == "columnar":
+            self.ids = list(result["ids"])
+            self.names = list(result["names"])
+            type_names = [entry["name"] for entry in result["types"]]
+            self.types = [""] * len(self.ids)
+            for node, type_index in zip(reversed(result["nodes"]["node"]), reversed(result["nodes"]["type"])):
+                self.types[node] = type_names[type_index]
+            self.index = {node_id: index for index, node_id in enumerate(self.ids)}
+            calls = result["linkTypes"].index("calls") if "calls" in result["linkTypes"] else -1
+            links = result["links"]
+            contains = result["linkTypes"].index("contains") if "contains" in result["linkTypes"] else -1
+            decorates = result["linkTypes"].index("decorates") if "decorates" in result["linkTypes"] else -1
+            edges = []
+            members = []
+            wrapped = []
+            for source, target, kind in zip(links["source"], links["target"], links["type"]):
+                if kind == calls:
+                    edges.append((source, target))
+                elif kind == contains:
+                    members.append((source, target))
+                elif kind == decorates:
+                    wrapped.append((source, target))
+        else:
+            self.ids = []
+            self.names = []
+            self.types = []
+            self.index = {}
+            for node in result["nodes"]:
+                if node["id"] not in self.index:
+                    self.index[node["id"]] = len(self.ids)
+                    self.ids.append(node["id"])
+                    self.names.append(node["name"])
+                    self.types.append(node["type"])
+            index = self.index
+            edges = []
+            members = []
+            wrapped = []
+            for link in result["links"]:
+                source = index.get(link["source"])
+                target = index.get(link["target"])
+                if source is None or target is None:
+                    continue
+                if link.get("type") == "calls":
+                    edges.append((source, target))
+                elif link.get("type") == "contains":
+                    members.append((source, target))
+                elif link.get("type") == "decorates":
+                    wrapped.append((source, target))
+
+        count = len(self.ids)
+        self.offsets, self.targets = self.adjacency(count, edges)
+        self.reverse_offsets, self.sources = self.adjacency(count, [(target, source) for source, target in edges])
+        # Calling a class runs its constructor, which no call link records.
+        self.constructors = {}
+        for source, target in members:
+            if self.types[source] == "Class" and self.names[target] in CONSTRUCTOR_NAMES:
+                self.constructors.setdefault(source, []).append(target)
+        # Likewise defining a decorated function runs its decorators.
+        self.decorators = {}
+        for source, target in wrapped:
+            self.decorators.setdefault(target, []).append(source)
+
+    @staticmethod
+    def adjacency(count, edges):
+        offsets = array("l", [0]) * (count + 1)
+        for source, _ in edges:
+            offsets[source + 1] += 1
+        for index in range(count):
+            offsets[index + 1] += offsets[index]
+        targets = array("l", [0]) * len(edges)
+        fill = offsets[:-1]
+        for source, target in edges:
+            targets[fill[source]] = target
+            fill[source] += 1
+        return offsets, targets
+
+    def callees(self, node):
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def callers(self, node):
+        return self.sources[self.reverse_offsets[node]:self.reverse_offsets[node + 1]]
+
+    def cycles(self):
+        # Iterative Tarjan; only components that recurse are reported.
+        offsets = self.offsets
+        targets = self.targets
+        count = len(self.ids)
+        order = array("l", [-1]) * count
+        low = array("l", [0]) * count
+        on_stack = bytearray(count)
+        stack = []
+        components = []
+        counter = 0
+
+        for root in range(count):
+            if order[root] != -1 or offsets[root] == offsets[root + 1]:
+                continue
+            order[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+            work = [[root, offsets[root]]]
+            while work:
+                frame = work[-1]
+                node, position = frame
+                if position < offsets[node + 1]:
+                    frame[1] = position + 1
+                    child = targets[position]
+                    if order[child] == -1:
+                        order[child] = low[child] = counter
+                        counter += 1
+                        stack.append(child)
+                        on_stack[child] = 1
+                        work.append([child, offsets[child]])
+                    elif on_stack[child] and order[child] < low[node]:
+                        low[node] = order[child]
+                    continue
+
+                work.pop()
+                if work and low[node] < low[work[-1][0]]:
+                    low[work[-1][0]] = low[node]
+                if low[node] != order[node]:
+                    continue
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = 0
+                    component.append(member)
+                    if member == node:
+                        break
+                if len(component) > 1 or node in self.callees(node):
+                    component.reverse()
+                    components.append(component)
+        return components
+
+    def fan_out(self, node):
+        return self.offsets[node + 1] - self.offsets[node]
+
+    def fan_in(self, node):
+        return self.reverse_offsets[node + 1] - self.reverse_offsets[node]
+
+    def ranking(self, degree, top=10):
+        return heapq.nlargest(top, (node for node in range(len(self.ids)) if degree(node)), key=degree)
+
+    def resolve(self, entries):
+        # Entry points are node ids, or bare names matching every callable
+        # of that name.
+        nodes = []
+        unknown = []
+        for entry in entries:
+            if entry in self.index:
+                nodes.append(self.index[entry])
+                continue
+            matches = [
+                node for node, name in enumerate(self.names)
+                if name == entry and self.types[node] in CALLABLE_TYPES
+            ]
+            if not matches:
+                unknown.append(entry)
+            nodes.extend(matches)
+        return nodes, unknown
+
+    def reachable(self, entries):
+        seen = bytearray(len(self.ids))
+        queue = deque()
+        for node in entries:
+            if not seen[node]:
+                seen[node] = 1
+                queue.append(node)
+        while queue:
+            node = queue.popleft()
+            implicit = itertools.chain(self.constructors.get(node, ()), self.decorators.get(node, ()))
+            for child in itertools.chain(self.callees(node), implicit):
+                if not seen[child]:
+                    seen[child] = 1
+                    queue.append(child)
+        return seen
+
+    def dead_functions(self, reached=None):
+        # Given the result of reachable(), dead means not reached from the
+        # entry points. Without one, it means never called, leaving out
+        # decorators, dunders and constructors that run implicitly.
+        callables = [node for node, node_type in enumerate(self.types) if node_type in CALLABLE_TYPES]
+        if reached is not None:
+            return [node for node in callables if not reached[node]]
+        used = {decorator for decorators in self.decorators.values() for decorator in decorators}
+        return [
+            node for node in callables
+            if node not in used
+            and all(caller == node for caller in self.callers(node))
+            and self.names[node] not in IMPLICIT_ENTRY_NAMES
+            and not (self.names[node].startswith("__") and self.names[node].endswith("__"))
+        ]
+
+def analyze_calls(result, entries=None, top=10):
+    if "error" in result:
+        return result
+    graph = CallGraph(result)
+    reached = None
+    if entries:
+        entry_nodes, unknown = graph.resolve(entries)
+        if unknown:
+            return {"error": f"Unknown entry points: {', '.join(unknown)}"}
+        reached = graph.reachable(entry_nodes)
+
+    def ranked(degree):
+        return [
+            {"id": graph.ids[node], "name": graph.names[node], "count": degree(node)}
+            for node in graph.ranking(degree, top)
+        ]
+
+    analysis = {
+        "functions": sum(1 for node_type in graph.types if node_type in CALLABLE_TYPES),
+        "calls": len(graph.targets),
+        "cycles": [[graph.ids[node] for node in component] for component in graph.cycles()],
+        "fanIn": ranked(graph.fan_in),
+        "fanOut": ranked(graph.fan_out),
+        "dead": [graph.ids[node] for node in graph.dead_functions(reached)],
+    }
+    if reached is not None:
+        analysis["reachable"] = [node_id for node_id, flag in zip(graph.ids, reached) if flag]
+    return {"analysis": analysis}
+
+JSON_CHUNK_ITEMS = 2048
+JSON_BUFFER_BYTES = 1 << 16
+JSON_ENCODER = json.JSONEncoder()
+COMPACT_JSON_ENCODER = json.JSONEncoder(separators=(",", ":"))
+
+def json_encoder(compact=False):
+    if compact and orjson is not None:
+        return functools.partial(orjson.dumps, option=orjson.OPT_NON_STR_KEYS)
+    encoder = COMPACT_JSON_ENCODER if compact else JSON_ENCODER
+    return lambda value: encoder.encode(value).encode("utf-8")
+
+def json_text(value, compact=False):
+    if compact and orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return (COMPACT_JSON_ENCODER if compact else JSON_ENCODER).encode(value)
+
+def iter_json(value, compact=False, extra=None):
+    # Dicts are walked key by key and long lists are encoded a slice at a
+    # time, so a large diagram never exists as one string. Each slice still
+    # goes through the C encoder (or orjson), which iterencode would not.
+    encode = json_encoder(compact)
+    item_separator, key_separator = (b",", b":") if compact else (b", ", b": ")
+
+    def chunks(value, extra=None):
+        if not isinstance(value, dict) or not all(isinstance(key, str) for key in value):
+            if isinstance(value, list) and len(value) > JSON_CHUNK_ITEMS:
+                yield b"["
+                for start in range(0, len(value), JSON_CHUNK_ITEMS):
+                    if start:
+                        yield item_separator
+                    yield encode(value[start:start + JSON_CHUNK_ITEMS])[1:-1]
+                yield b"]"
+            else:
+                yield encode(value)
+            return
+
+        yield b"{"
+        first = True
+        items = value.items()
+        while items is not None:
+            for key, item in items:
+                if not first:
+                    yield item_separator
+                first = False
+                yield encode(key) + key_separator
+                yield from chunks(item)
+            # Extra items are computed only after the body has been written,
+            # which lets the CLI report the serialization time itself.
+            items = extra().items() if extra else None
+            extra = None
+        yield b"}"
+
+    return chunks(value, extra)
+
+def write_json(value, stream=None, compact=False, extra=None):
+    stream = stream or sys.stdout.buffer
+    buffer = bytearray()
+    for chunk in iter_json(value, compact, extra):
+        buffer += chunk
+        if len(buffer) >= JSON_BUFFER_BYTES:
+            stream.write(buffer)
+            buffer.clear()
+    buffer += b"\n"
+    stream.write(buffer)
+    stream.flush()
+
+MERMAID_LINKS = {"contains": "-->", "calls": "-.->", "imports": "==>"}
+MERMAID_ESCAPES = str.maketrans({'"': "#quot;", "<": "#lt;", ">": "#gt;", "\n": " ", "\r": " "})
+
+def mermaid_graph_format(max_nodes=None, max_depth=None):
+    # Folding needs the json layout; otherwise the columnar one is cheaper
+    # to build, and nothing but names, types and links ends up in the chart.
+    return "json" if max_nodes is not None or max_depth is not None else "columnar"
+
+def mermaid_class(node_type):
+    return re.sub(r'\W', "_", node_type or "Other") + "Node"
+
+def iter_mermaid(result, direction="TD"):
+    # Yields the chart line by line. Node ids become n0, n1, ... because
+    # diagram ids contain characters Mermaid does not accept in ids.
+    yield f"flowchart {direction}\n"
+    if result.get("format") == "columnar":
+        for node_type in result["types"]:
+            yield (f"    classDef {mermaid_class(node_type['name'])} "
+                   f"fill:{node_type['color']},stroke:{node_type['color']},color:{node_type['textColor']}\n")
+        type_classes = [mermaid_class(node_type["name"]) for node_type in result["types"]]
+        names = result["names"]
+        for node, type_index in zip(result["nodes"]["node"], result["nodes"]["type"]):
+            yield f'    n{node}["{names[node].translate(MERMAID_ESCAPES)}"]:::{type_classes[type_index]}\n'
+        arrows = [MERMAID_LINKS.get(link_type, f"-.->|{link_type}|") for link_type in result["linkTypes"]]
+        links = result["links"]
+        for source, target, kind in zip(links["source"], links["target"], links["type"]):
+            yield f"    n{source} {arrows[kind]} n{target}\n"
+        return
+
+    nodes = result["nodes"]
+    colors = {}
+    for node in nodes:
+        if node["type"] not in colors:
+            colors[node["type"]] = (node["color"], node.get("textColor", "#FFFFFF"))
+    for node_type, (fill, text) in colors.items():
+        yield f"    classDef {mermaid_class(node_type)} fill:{fill},stroke:{fill},color:{text}\n"
+
+    index = {}
+    for node in nodes:
+        if node["id"] in index:
+            continue
+        index[node["id"]] = len(index)
+        yield f'    n{index[node["id"]]}["{str(node["name"]).translate(MERMAID_ESCAPES)}"]:::{mermaid_class(node["type"])}\n'
+    for link in result["links"]:
+        source = index.get(link["source"])
+        target = index.get(link["target"])
+        if source is not None and target is not None:
+            link_type = link.get("type", "contains")
+            yield f"    n{source} {MERMAID_LINKS.get(link_type, f'-.->|{link_type}|')} n{target}\n"
+
+def write_mermaid(result, stream=None, extra_lines=()):
+    stream = stream or sys.stdout.buffer
+    buffer = bytearray()
+    for line in itertools.chain(iter_mermaid(result), extra_lines):
+        buffer += line.encode("utf-8")
+        if len(buffer) >= JSON_BUFFER_BYTES:
+            stream.write(buffer)
+            buffer.clear()
+    stream.write(buffer)
+    stream.flush()
+
+def integer_at_least(minimum):
+    def convert(text):
+        try:
+            value = int(text)
+        except ValueError:
+            value = None
+        if value is None or value < minimum:
+            raise argparse.ArgumentTypeError(f"must be an integer of at least {minimum}")
+        return value
+    return convert
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate diagram data from source code read on stdin.")
+    parser.add_argument("language", nargs="?", help="language of the code read from stdin")
+    parser.add_argument("filename", nargs="?", help="file name used as the diagram root label")
+    parser.add_argument("--serve", action="store_true", help="answer newline-delimited JSON requests on stdin")
+    parser.add_argument("--cache-dir", help="directory for the on-disk result cache")
+    parser.add_argument("--batch", nargs="+", metavar="PATH", help="parse these files or directories instead of stdin")
+    parser.add_argument("--glob", help="pattern selecting files inside --batch directories")
+    parser.add_argument("--workers", type=integer_at_least(1), help="number of worker processes for --batch, --project and large Python files")
+    parser.add_argument("--format", choices=["json", "columnar", "mermaid"], default="json",
+                        help="output layout for nodes and links, or a Mermaid flowchart")
+    parser.add_argument("--lazy-details", action="store_true", help="leave function and class details out of the graph")
+    parser.add_argument("--details", nargs="+", metavar="NODE_ID", help="print the details of these nodes instead of a diagram")
+    parser.add_argument("--max-nodes", type=integer_at_least(1), help="fold classes and sibling groups until the graph fits this many nodes")
+    parser.add_argument("--max-depth", type=integer_at_least(0), help="fold every container nested deeper than this")
+    parser.add_argument("--expand", nargs="+", metavar="NODE_ID", help="keep these containers open when folding")
+    parser.add_argument("--layout", action="store_true", help="attach layered x/y coordinates to every node")
+    parser.add_argument("--validate", choices=VALIDATION_MODES, default="auto",
+                        help="full re-checks ids and link endpoints in bulk; auto only checks the result's shape")
+    parser.add_argument("--profile", action="store_true", help="attach per-phase timings and counts as a metrics object")
+    parser.add_argument("--profile-memory", action="store_true", help="also trace allocations per phase (slower)")
+    parser.add_argument("--profile-dump", metavar="PATH", help="write cProfile stats for the whole run to PATH")
+    parser.add_argument("--stream", action="store_true", help="write nodes and links as newline-delimited JSON records")
+    parser.add_argument("--analyze", action="store_true",
+                        help="print call-graph analytics (cycles, fan-in/out, dead functions) instead of the diagram")
+    parser.add_argument("--entry", nargs="+", metavar="NODE", help="entry point ids or names for --analyze reachability")
+    parser.add_argument("--compact", action="store_true",
+                        help="write JSON without spaces after separators, through orjson when it is installed")
+    parser.add_argument("--project", metavar="DIR", help="build one cross-module graph for a Python source tree")
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(cache=ResultCache(cache_dir=args.cache_dir), compact=args.compact)
+        return 0
+
+    if args.project:
+        mermaid = args.format == "mermaid" and not args.analyze
+        output_format = mermaid_graph_format() if args.format == "mermaid" else args.format
+        result = generate_python_project_diagram(args.project, workers=args.workers, output_format=output_format)
+        if args.analyze:
+            result = analyze_calls(result, args.entry)
+        if mermaid and "error" not in result:
+            write_mermaid(result)
+        else:
+            write_json(result, compact=args.compact)
+        return 0
+
+    if args.batch:
+        files = collect_files(args.batch, args.glob)
+        write_json(parse_files(files, args.workers, args.cache_dir, args.format), compact=args.compact)
+        return 0
+
+    if not args.language:
+        print(json.dumps({"error": "No language provided"}))
+        return 1
+
+    filename = os.path.basename(args.filename) if args.filename else None
+
     code = sys.stdin.read()
 
     if not code:
         print(json.dumps({"error": "No code provided"}))
-        sys.exit(1)
+        return 1
+
+    if args.stream:
+        summary = stream_code(code, args.language, filename, compact=args.compact)
+        return 1 if "error" in summary else 0
+
+    if args.details:
+        result = describe_nodes(code, args.language, args.details, filename)
+        write_json(result, compact=args.compact)
+        return 1 if "error" in result else 0
+
+    cache = ResultCache(cache_dir=args.cache_dir) if args.cache_dir else None
+    profile = "memory" if args.profile_memory else args.profile
+    # Mermaid is streamed straight from the graph rather than built as one
+    # string by parse_code; Mermaid places nodes itself, so --layout is moot.
+    mermaid = args.format == "mermaid"
+    output_format = mermaid_graph_format(args.max_nodes, args.max_depth) if mermaid else args.format
+    diagram = parse_code(
+        code, args.language, filename, cache, profile, args.profile_dump, output_format, args.lazy_details,
+        args.max_nodes, args.max_depth, args.expand, args.layout and not mermaid, args.workers, args.validate,
+    )
+
+    if args.analyze:
+        diagram = analyze_calls(diagram, args.entry)
+        write_json(diagram, compact=args.compact)
+        return 1 if "error" in diagram else 0
+
+    if mermaid and "error" not in diagram:
+        metrics = diagram.pop("metrics", None)
+        write_mermaid(diagram, extra_lines=[f"%% metrics: {json.dumps(metrics)}\n"] if metrics else ())
+        return 0
+
+    metrics = diagram.pop("metrics", None)
+    start = time.perf_counter()
+
+    def timed_metrics():
+        metrics["phases_ms"]["serialization"] = round((time.perf_counter() - start) * 1000, 3)
+        return {"metrics": metrics}
+
+    write_json(diagram, compact=args.compact, extra=timed_metrics if metrics is not None else None)
+    return 0
 
-    diagram = parse_code(code, language, filename)
-    print(json.dumps(diagram))
+if __name__ == "__main__":
+    sys.exit(main())
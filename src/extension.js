@@ -107,7 +107,49 @@ function handleDiagramResult(result, meta) {
     showDiagram(result, meta);
 }
 
-async function runPythonParser(code, language, fileName) {
+let parserProcess = null;
+let parserStarting = null;
+let parserBuffer = '';
+let nextRequestId = 0;
+const pendingRequests = new Map();
+
+// Larger graphs are folded by the parser before they reach the force layout
+const MAX_DIAGRAM_NODES = 500;
+
+// A request unanswered for this long means the daemon hung; it is restarted
+const PARSER_TIMEOUT_MS = 30000;
+
+function getParserProcess() {
+    // The pending start is shared so that commands fired while Python is
+    // still being checked reuse one daemon instead of spawning their own.
+    if (!parserStarting) {
+        parserStarting = startParserProcess().catch((error) => {
+            parserStarting = null;
+            throw error;
+        });
+    }
+    return parserStarting;
+}
+
+function stopParserProcess(pythonProcess, error) {
+    // Forget the daemon first so the next request starts a fresh one, then
+    // fail whatever was still waiting on it.
+    if (parserProcess === pythonProcess) {
+        parserProcess = null;
+        parserStarting = null;
+    }
+    pendingRequests.forEach((pending, id) => {
+        if (pending.process === pythonProcess) {
+            pendingRequests.delete(id);
+            pending.reject(error);
+        }
+    });
+    if (pythonProcess.exitCode === null && !pythonProcess.killed) {
+        pythonProcess.kill();
+    }
+}
+
+async function startParserProcess() {
     await checkPythonInstallation();
 
     const tempDir = path.join(extensionContext.extensionPath, 'temp');
@@ -119,34 +161,81 @@ async function runPythonParser(code, language, fileName) {
     const parserSource = path.join(extensionContext.extensionPath, 'src', 'code_parser.py');
     fs.copyFileSync(parserSource, parserPath);
 
-    return new Promise((resolve, reject) => {
-        const basename = path.basename(fileName || 'module.py');
-        const pythonProcess = spawn('python', [parserPath, language, basename]);
-        let output = '';
-        let errorOutput = '';
-
-        pythonProcess.stdin.write(code);
-        pythonProcess.stdin.end();
-
-        pythonProcess.stdout.on('data', (data) => {
-            output += data.toString();
-        });
-
-        pythonProcess.stderr.on('data', (data) => {
-            errorOutput += data.toString();
-        });
-
-        pythonProcess.on('close', (exitCode) => {
-            if (exitCode !== 0) {
-                reject(new Error(errorOutput || 'Python parser failed'));
-                return;
+    const cacheDir = path.join(tempDir, 'cache');
+    const pythonProcess = spawn('python', [parserPath, '--serve', '--compact', '--cache-dir', cacheDir]);
+    let errorOutput = '';
+    parserBuffer = '';
+
+    // Decode as one UTF-8 stream so a character split across two chunks
+    // is not mangled.
+    pythonProcess.stdout.setEncoding('utf8');
+    pythonProcess.stdout.on('data', (data) => {
+        // Only the new chunk can hold a newline; the buffered part was
+        // already scanned.
+        let searchFrom = parserBuffer.length;
+        parserBuffer += data;
+        let newline;
+        while ((newline = parserBuffer.indexOf('\n', searchFrom)) !== -1) {
+            const line = parserBuffer.slice(0, newline);
+            parserBuffer = parserBuffer.slice(newline + 1);
+            searchFrom = 0;
+            if (!line.trim()) {
+                continue;
             }
+            let response;
             try {
-                resolve(JSON.parse(output));
+                response = JSON.parse(line);
             } catch (error) {
-                reject(new Error(`Failed to parse output: ${error.message}`));
+                console.error('Failed to parse parser response:', error.message);
+                continue;
             }
-        });
+            // Stderr is only reported for the failure that follows it.
+            errorOutput = '';
+            const pending = pendingRequests.get(response.id);
+            if (pending) {
+                pendingRequests.delete(response.id);
+                pending.resolve(response.result);
+            }
+        }
+    });
+
+    pythonProcess.stderr.on('data', (data) => {
+        errorOutput += data.toString();
+    });
+
+    // Writing to a daemon that already exited fails with EPIPE here rather
+    // than throwing from write().
+    pythonProcess.stdin.on('error', (error) => {
+        stopParserProcess(pythonProcess, new Error(errorOutput || `Python parser stopped: ${error.message}`));
+    });
+
+    pythonProcess.on('error', (error) => {
+        stopParserProcess(pythonProcess, error);
+    });
+
+    pythonProcess.on('close', () => {
+        stopParserProcess(pythonProcess, new Error(errorOutput || 'Python parser failed'));
+    });
+
+    parserProcess = pythonProcess;
+    return parserProcess;
+}
+
+async function runPythonParser(code, language, fileName) {
+    const pythonProcess = await getParserProcess();
+
+    return new Promise((resolve, reject) => {
+        const id = nextRequestId++;
+        const basename = path.basename(fileName || 'module.py');
+        const timer = setTimeout(() => {
+            stopParserProcess(pythonProcess, new Error(`Python parser did not answer within ${PARSER_TIMEOUT_MS / 1000} seconds`));
+        }, PARSER_TIMEOUT_MS);
+        const settle = (callback) => (value) => {
+            clearTimeout(timer);
+            callback(value);
+        };
+        pendingRequests.set(id, { resolve: settle(resolve), reject: settle(reject), process: pythonProcess });
+        pythonProcess.stdin.write(JSON.stringify({ id, language, filename: basename, code, maxNodes: MAX_DIAGRAM_NODES, layout: true }) + '\n');
     });
 }
 
@@ -451,6 +540,16 @@ function showDiagram(data, meta = {}) {
                             .force('collision', d3.forceCollide().radius(140))
                             .force('x', d3.forceX(virtualWidth / 2).strength(0.02))
                             .force('y', d3.forceY(virtualHeight / 2).strength(0.02));
+
+                        // Positions precomputed by the parser are pinned and only the
+                        // link force is kept, so the simulation never has to settle
+                        if (data.layout) {
+                            data.nodes.forEach(d => {
+                                d.fx = d.x;
+                                d.fy = d.y;
+                            });
+                            ['charge', 'center', 'collision', 'x', 'y'].forEach(name => simulation.force(name, null));
+                        }
                             
                         // Line generator for curved links
                         const linkGenerator = d3.linkHorizontal()
@@ -506,7 +605,7 @@ function showDiagram(data, meta = {}) {
                         const gradients = defs.selectAll('.node-gradient')
                             .data(data.nodes)
                             .join('linearGradient')
-                            .attr('id', d => 'gradient-' + d.id)
+                            .attr('id', (d, i) => 'gradient-' + i)
                             .attr('x1', '0%')
                             .attr('x2', '0%')
                             .attr('y1', '0%')
@@ -528,7 +627,7 @@ function showDiagram(data, meta = {}) {
                             .attr('rx', 8)
                             .attr('ry', 8)
                             .attr('stroke-width', 2)
-                            .attr('fill', d => 'url(#gradient-' + d.id + ')')
+                            .attr('fill', (d, i) => 'url(#gradient-' + i + ')')
                             .attr('stroke', ${isDarkTheme ? "'#555'" : "'#ccc'"});
                         
                         // Add text labels with improved styling
@@ -605,14 +704,19 @@ function showDiagram(data, meta = {}) {
                         
                         console.log('Setting up simulation tick');
                         // Update positions on simulation tick with curved links
-                        simulation.on('tick', () => {
+                        const ticked = () => {
                             link.attr('d', d => {
                                 const path = \`M\${d.source.x},\${d.source.y} C\${(d.source.x + d.target.x) / 2},\${d.source.y} \${(d.source.x + d.target.x) / 2},\${d.target.y} \${d.target.x},\${d.target.y}\`;
                                 return path;
                             });
                                 
                             node.attr('transform', d => \`translate(\${d.x},\${d.y})\`);
-                        });
+                        };
+                        simulation.on('tick', ticked);
+                        if (data.layout) {
+                            simulation.stop();
+                            ticked();
+                        }
                         
                         // Drag functions
                         function dragstarted(event) {
@@ -635,10 +739,10 @@ function showDiagram(data, meta = {}) {
                         
                         // Adjust forces for optimal layout
                         const nodeCount = data.nodes.length;
-                        if (nodeCount > 10) {
+                        if (!data.layout && nodeCount > 10) {
                             simulation.force('link').distance(280);
                             simulation.force('charge').strength(-3200);
-                        } else if (nodeCount < 5) {
+                        } else if (!data.layout && nodeCount < 5) {
                             simulation.force('link').distance(200);
                             simulation.force('charge').strength(-1800);
                         }
@@ -858,7 +962,13 @@ function generateSVGContent(data, isDarkTheme) {
     return svg;
 }
 
-function deactivate() {}
+function deactivate() {
+    if (parserProcess) {
+        parserProcess.stdin.end();
+        parserProcess = null;
+    }
+    parserStarting = null;
+}
 
 module.exports = {
     activate,